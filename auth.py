@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import time
+
+import jwt
+
+from cache import ContentCache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens without a round trip to the auth server.
+
+    HS256 tokens are checked against the project JWT secret; asymmetric tokens
+    against the project's JWKS, which is fetched lazily and refreshed every
+    jwks_refresh seconds (or sooner when a token names an unknown key id).
+    Verified claims are cached by token hash until the token's exp, in
+    cache_path when given so every worker process shares them.
+
+    verify() returns None when the token can't be checked locally, in which
+    case the caller should fall back to supabase.auth.get_user().
+    """
+
+    def __init__(self, supabase_url, jwt_secret=None, http_client=None, api_key=None,
+                 audience="authenticated", jwks_refresh=600, cache_size=10000, cache_path=None):
+        self.jwt_secret = jwt_secret
+        self.http_client = http_client
+        self.api_key = api_key
+        self.audience = audience
+        self.jwks_url = f"{supabase_url}/auth/v1/.well-known/jwks.json" if supabase_url else None
+        self.jwks_refresh = jwks_refresh
+        self._jwks = {}
+        self._jwks_fetched_at = 0.0
+        self.cache = ContentCache(maxsize=cache_size, path=cache_path, table="token")
+
+    @staticmethod
+    def token_key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def cached(self, token):
+        return self.cache.get(self.token_key(token))
+
+    def remember(self, token, claims):
+        ttl = claims.get("exp", 0) - time.time()
+        if ttl > 0:
+            self.cache.set(self.token_key(token), claims, ttl=ttl)
+
+    async def _refresh_jwks(self, force=False):
+        if self.jwks_url is None or self.http_client is None:
+            return
+        if not force and time.monotonic() - self._jwks_fetched_at < self.jwks_refresh:
+            return
+        self._jwks_fetched_at = time.monotonic()
+        try:
+            headers = {"apikey": self.api_key} if self.api_key else {}
+            response = await self.http_client.get(self.jwks_url, headers=headers)
+            response.raise_for_status()
+            keys = {}
+            for data in response.json().get("keys", []):
+                try:
+                    key = jwt.PyJWK(data)
+                except jwt.PyJWKError as e:
+                    logger.error("Skipping unusable JWKS key %s: %s", data.get("kid"), e)
+                    continue
+                keys[key.key_id] = key
+            self._jwks = keys
+        except Exception as e:
+            logger.error("Failed to fetch JWKS: %s", e)
+
+    async def _signing_key(self, header):
+        # The algorithm comes from the key, never from the token: a token naming
+        # another one (e.g. HS256 against a public key) must not pick how it's checked
+        if header.get("alg") == "HS256":
+            return self.jwt_secret, "HS256"
+        kid = header.get("kid")
+        await self._refresh_jwks()
+        if kid not in self._jwks:
+            # Keys may have rotated since the last fetch
+            await self._refresh_jwks(force=time.monotonic() - self._jwks_fetched_at > 30)
+        key = self._jwks.get(kid)
+        return (key.key, key.algorithm_name) if key is not None else (None, None)
+
+    async def verify(self, token):
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+        try:
+            header = jwt.get_unverified_header(token)
+            key, algorithm = await self._signing_key(header)
+            if key is None:
+                return None
+            claims = jwt.decode(
+                token, key, algorithms=[algorithm], audience=self.audience, options={"require": ["exp", "sub"]}
+            )
+        except jwt.ExpiredSignatureError:
+            raise
+        except (jwt.PyJWTError, TypeError, ValueError) as e:
+            # Could be a misconfigured secret rather than a bad token; let the server decide
+            logger.error("Local token verification failed: %s", e)
+            return None
+        claims = {
+            "sub": claims["sub"],
+            "exp": claims["exp"],
+            "user_metadata": claims.get("user_metadata") or {},
+        }
+        self.remember(token, claims)
+        return claims
+
+    def remember_remote(self, token, user):
+        # The server vouched for the token, so its exp is safe to read unverified
+        try:
+            exp = jwt.decode(token, options={"verify_signature": False}).get("exp", 0)
+        except jwt.InvalidTokenError:
+            return None
+        claims = {"sub": user.id, "exp": exp, "user_metadata": user.user_metadata or {}}
+        self.remember(token, claims)
+        return claims
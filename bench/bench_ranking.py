@@ -0,0 +1,54 @@
+"""Microbenchmarks for the local course ranking engine.
+
+    python bench/bench_ranking.py [--batch 1000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from ranking import RankingEngine  # noqa: E402
+
+SOFT = ["Communication", "Leadership", "Teamwork", "Problem solving", "Empathy", "Patience", "Critical thinking", "Negotiation"]
+TECHNICAL = ["Python", "Excel", "AutoCAD", "Electronics", "Bookkeeping", "Photography", "Web design", "Laboratory work"]
+ACTIVITIES = ["coding and gaming", "reading novels and debate", "farming with my family", "fixing cars", "teaching children", "caring for patients", "writing stories for social media"]
+
+
+def random_input(rng, engine):
+    return database.UserInput(
+        username="bench",
+        task_activities=rng.choice(ACTIVITIES),
+        **{f"softskill{i}": rng.choice(SOFT) for i in range(1, 4)},
+        **{f"technical{i}": rng.choice(TECHNICAL) for i in range(1, 4)},
+        **{f"career{i}": rng.choice(engine.courses) for i in range(1, 4)},
+    )
+
+
+def report(name, seconds, calls):
+    print(f"{name:<28} {seconds / calls * 1e6:10.1f} us/input")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = RankingEngine.load(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "course_affinity.json"))
+    rng = random.Random(0)
+    inputs = [random_input(rng, engine) for _ in range(args.batch)]
+    single = inputs[0]
+
+    number = 2000
+    report("rank (single)", min(timeit.repeat(lambda: engine.rank(single), number=number, repeat=args.repeat)), number)
+    report("encode (single)", min(timeit.repeat(lambda: engine.encode(single), number=number, repeat=args.repeat)), number)
+    report(f"rank_batch ({args.batch})", min(timeit.repeat(lambda: engine.rank_batch(inputs), number=1, repeat=args.repeat)), args.batch)
+    report(f"score_batch ({args.batch})", min(timeit.repeat(lambda: engine.score_batch(inputs), number=1, repeat=args.repeat)), args.batch)
+
+
+if __name__ == "__main__":
+    main()
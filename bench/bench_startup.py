@@ -0,0 +1,116 @@
+"""Startup-time benchmark: how long until the app can answer requests.
+
+Measures, each over --repeat fresh processes:
+
+- import: time to `import main`, and which LLM SDKs that already loaded
+- uvicorn: spawn a single uvicorn process until its first HTTP response
+- gunicorn: the same for gunicorn.conf.py with --workers uvicorn workers
+  (skipped with --workers 0)
+
+Nothing upstream is contacted; the app gets placeholder credentials and a
+throwaway cache file.
+
+    python bench/bench_startup.py [--repeat 5] [--workers 4]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import main
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "sdks": [name for name in ("openai", "groq", "supabase") if name in sys.modules],
+}))
+"""
+
+
+def app_env(tmp):
+    return {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "API_KEY": "bench",
+        "GROQ_API_KEY": "bench",
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        # supabase-py only checks that the key looks like a JWT
+        "SUPABASE_ANON_KEY": jwt.encode({"role": "anon"}, "bench-secret-bench-secret-bench!", algorithm="HS256"),
+        "CONTENT_CACHE_PATH": os.path.join(tmp, "cache.db"),
+        "BULK_JOBS_PATH": os.path.join(tmp, "bulk.db"),
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(tmp, "metrics"),
+    }
+
+
+def time_import(env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def time_ready(command, env, port, timeout=60):
+    # One client for all polls: building one per poll costs more than the wait being measured
+    with httpx.Client(timeout=1) as client:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{command[0]} exited early:\n{process.stderr.read().decode()}")
+                try:
+                    client.get(f"http://127.0.0.1:{port}/cache_stats")
+                    return time.perf_counter() - started
+                except httpx.HTTPError:
+                    time.sleep(0.02)
+            raise RuntimeError(f"not ready within {timeout}s")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def report(name, samples):
+    print(
+        f"{name:<24} median {statistics.median(samples) * 1000:8.1f} ms"
+        f"   min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=9111)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = app_env(tmp)
+        os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+
+        imports = [time_import(env) for _ in range(args.repeat)]
+        report("import main", [sample["seconds"] for sample in imports])
+        print(f"{'SDKs loaded at import':<24} {', '.join(imports[-1]['sdks']) or 'none'}")
+
+        uvicorn = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"]
+        report("uvicorn, 1 process", [time_ready(uvicorn, env, args.port) for _ in range(args.repeat)])
+
+        if args.workers:
+            gunicorn = [
+                sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+                "--workers", str(args.workers), "--bind", f"127.0.0.1:{args.port}",
+            ]
+            report(f"gunicorn, {args.workers} workers", [time_ready(gunicorn, env, args.port) for _ in range(args.repeat)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""OpenAI/Groq-compatible chat completions server for benchmarks.
+
+Answers POST /openai/v1/chat/completions (the Groq SDK path) and
+/v1/chat/completions with generated text, optionally streamed. Timing is
+controlled by environment variables so runs are reproducible:
+
+    FAKE_LLM_TTFT         seconds before the first token (default 0.3)
+    FAKE_LLM_TOKENS       completion length in tokens (default 150)
+    FAKE_LLM_TOKEN_RATE   tokens per second after the first (default 300)
+    FAKE_LLM_ERROR_RATE   fraction of requests answered with a 429 (default 0)
+
+    uvicorn bench.fake_groq:app --port 9001
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TTFT = float(os.environ.get("FAKE_LLM_TTFT", 0.3))
+TOKENS = int(os.environ.get("FAKE_LLM_TOKENS", 150))
+TOKEN_RATE = float(os.environ.get("FAKE_LLM_TOKEN_RATE", 300))
+ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", 0))
+
+WORDS = "the course offers strong career prospects in Nigeria with growing demand across industries".split()
+
+app = FastAPI()
+stats = {"requests": 0, "streams": 0, "cancelled": 0, "rate_limited": 0}
+
+
+def prompt_tokens(messages):
+    return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+
+def completion_length(body):
+    return min(TOKENS, body.get("max_tokens") or TOKENS)
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/openai/v1/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+            status_code=429,
+            headers={"retry-after": "1"},
+        )
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "fake")
+    length = completion_length(body)
+    usage = {
+        "prompt_tokens": prompt_tokens(body.get("messages", [])),
+        "completion_tokens": length,
+        "total_tokens": prompt_tokens(body.get("messages", [])) + length,
+    }
+
+    if body.get("stream"):
+        stats["streams"] += 1
+
+        async def chunks():
+            try:
+                await asyncio.sleep(TTFT)
+                for i in range(length):
+                    if i:
+                        await asyncio.sleep(1 / TOKEN_RATE)
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": WORDS[i % len(WORDS)] + " "}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "x_groq": {"usage": usage},
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            except asyncio.CancelledError:
+                stats["cancelled"] += 1
+                raise
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    await asyncio.sleep(TTFT + max(length - 1, 0) / TOKEN_RATE)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": " ".join(WORDS[i % len(WORDS)] for i in range(length))},
+            }
+        ],
+        "usage": usage,
+    }
@@ -0,0 +1,154 @@
+"""PostgREST/GoTrue stand-in for benchmarks.
+
+Implements just enough of Supabase for this app: select (with the
+careers/softskills/technicalSkills embeds used by /get_user_info), insert,
+upsert via on_conflict and update with eq filters on the four tables, plus
+GET /auth/v1/user and an empty JWKS. Data lives in memory and is seeded with
+FAKE_DB_USERS users named user-0, user-1, ...
+
+    FAKE_DB_LATENCY   seconds added to every request (default 0.02)
+    FAKE_DB_USERS     number of seeded users (default 1000)
+
+    uvicorn bench.fake_supabase:app --port 9002
+"""
+import asyncio
+import os
+import re
+import time
+import uuid
+
+import jwt
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCY = float(os.environ.get("FAKE_DB_LATENCY", 0.02))
+USERS = int(os.environ.get("FAKE_DB_USERS", 1000))
+
+TABLES = ("profiles", "careers", "softskills", "technicalSkills")
+CHILD_TABLES = TABLES[1:]
+EMBED = re.compile(r"(\w+)\(\*\)")
+
+app = FastAPI()
+db = {table: {} for table in TABLES}
+stats = {table: {"select": 0, "insert": 0, "upsert": 0, "update": 0} for table in TABLES}
+
+
+def seed():
+    for i in range(USERS):
+        user_id = f"user-{i}"
+        db["profiles"][user_id] = {
+            "id": user_id,
+            "displayName": f"User {i}",
+            "email": f"user{i}@example.com",
+            "photoURL": None,
+            "highestEducationLevel": "Secondary",
+            "who_are_you": "student",
+            "activities": "reading",
+        }
+        db["careers"][user_id] = {"id": i, "userId": user_id, "career1": "Law", "career2": "Computer Science", "career3": "Pharmacy"}
+        db["softskills"][user_id] = {"id": i, "userId": user_id, "softskill1": "Communication", "softskill2": "Teamwork", "softskill3": "Leadership"}
+        db["technicalSkills"][user_id] = {"id": i, "userId": user_id, "technical1": "Excel", "technical2": "Python", "technical3": "AutoCAD"}
+
+
+seed()
+
+
+def key_column(table):
+    return "id" if table == "profiles" else "userId"
+
+
+def filters(request):
+    result = {}
+    for name, value in request.query_params.items():
+        if name in ("select", "on_conflict", "columns"):
+            continue
+        if value.startswith("eq."):
+            result[name] = value[3:]
+    return result
+
+
+def matching(table, request):
+    wanted = filters(request)
+    return [row for row in db[table].values() if all(str(row.get(k)) == v for k, v in wanted.items())]
+
+
+def with_embeds(row, select):
+    row = dict(row)
+    for child in EMBED.findall(select or ""):
+        if child in CHILD_TABLES:
+            found = db[child].get(row["id"])
+            row[child] = [found] if found else []
+    return row
+
+
+def content_range(rows):
+    return {"Content-Range": f"0-{max(len(rows) - 1, 0)}/{len(rows)}"}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.get("/rest/v1/{table}")
+async def select(table: str, request: Request):
+    await asyncio.sleep(LATENCY)
+    stats[table]["select"] += 1
+    rows = [with_embeds(row, request.query_params.get("select")) for row in matching(table, request)]
+    return JSONResponse(rows, headers=content_range(rows))
+
+
+@app.post("/rest/v1/{table}")
+async def insert(table: str, request: Request):
+    await asyncio.sleep(LATENCY)
+    payload = await request.json()
+    rows = payload if isinstance(payload, list) else [payload]
+    upsert = "merge-duplicates" in request.headers.get("prefer", "")
+    stats[table]["upsert" if upsert else "insert"] += 1
+    saved = []
+    for row in rows:
+        key = row.get(key_column(table))
+        existing = db[table].get(key)
+        if existing is not None and not upsert:
+            return JSONResponse({"code": "23505", "message": "duplicate key value violates unique constraint"}, status_code=409)
+        merged = {**(existing or {"id": key if table == "profiles" else uuid.uuid4().int % 10**9}), **row}
+        db[table][key] = merged
+        saved.append(merged)
+    return JSONResponse(saved, status_code=201, headers=content_range(saved))
+
+
+@app.patch("/rest/v1/{table}")
+async def update(table: str, request: Request):
+    await asyncio.sleep(LATENCY)
+    stats[table]["update"] += 1
+    changes = await request.json()
+    rows = matching(table, request)
+    for row in rows:
+        row.update(changes)
+    return JSONResponse(rows, headers=content_range(rows))
+
+
+@app.get("/auth/v1/user")
+async def auth_user(request: Request):
+    await asyncio.sleep(LATENCY)
+    token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        return JSONResponse({"code": 401, "msg": "invalid JWT"}, status_code=401)
+    if claims.get("exp", 0) < time.time():
+        return JSONResponse({"code": 401, "msg": "token is expired"}, status_code=401)
+    return {
+        "id": claims["sub"],
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": claims.get("user_metadata", {}).get("email"),
+        "app_metadata": {},
+        "user_metadata": claims.get("user_metadata", {}),
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+
+
+@app.get("/auth/v1/.well-known/jwks.json")
+async def jwks():
+    return {"keys": []}
@@ -0,0 +1,291 @@
+"""Replays a JSONL traffic mix against the app backed by local fakes.
+
+Starts bench/fake_groq.py, bench/fake_supabase.py and the app (through
+bench/serve_app.py) as subprocesses, points the app at the fakes with the
+usual environment variables, then drives it with --concurrency workers for
+--duration seconds. Each traffic record is picked by its "weight"; the
+placeholders $USER_ID, $USERNAME, $TOKEN, $COURSE, $SOFTSKILL, $TECHNICAL and
+$ACTIVITY are filled in from a seeded RNG so runs are repeatable.
+
+The report has RPS and p50/p95/p99 latency per endpoint plus the app's
+event-loop lag. Save it with --out and pass it back later as --baseline to
+see the change.
+
+    python bench/loadtest.py --duration 30 --concurrency 32 --out before.json
+    python bench/loadtest.py --duration 30 --concurrency 32 --baseline before.json
+
+Use --app-url to drive an already running app instead of spawning one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = "bench-jwt-secret-bench-jwt-secret"
+ANON_KEY = jwt.encode({"role": "anon"}, JWT_SECRET, algorithm="HS256")
+
+COURSES = [
+    "Medicine and Surgery", "Law", "Civil Engineering", "Mechanical Engineering",
+    "Electrical Engineering", "Computer Science", "Information Technology",
+    "Business Administration", "Accounting", "Nursing and Nursing Science",
+    "Agriculture", "Mass Communication", "Environmental Science", "Education", "Pharmacy",
+]
+SOFTSKILLS = ["Communication", "Leadership", "Teamwork", "Problem solving", "Empathy", "Patience"]
+TECHNICAL = ["Python", "Excel", "AutoCAD", "Electronics", "Bookkeeping", "Photography"]
+ACTIVITIES = ["coding and gaming", "reading and debate", "farming", "fixing cars", "teaching children", "caring for patients"]
+
+
+def load_traffic(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return records, [record.get("weight", 1) for record in records]
+
+
+class Filler:
+    def __init__(self, rng, users):
+        self.rng = rng
+        self.users = users
+
+    def token(self, user_id):
+        claims = {
+            "sub": user_id,
+            "aud": "authenticated",
+            "exp": int(time.time()) + 3600,
+            "user_metadata": {"avatar_url": "", "email": f"{user_id}@example.com", "full_name": user_id},
+        }
+        return jwt.encode(claims, JWT_SECRET, algorithm="HS256")
+
+    def fill(self, value, user_id):
+        if isinstance(value, dict):
+            return {k: self.fill(v, user_id) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.fill(v, user_id) for v in value]
+        if not isinstance(value, str) or "$" not in value:
+            return value
+        replacements = {
+            "$USER_ID": lambda: user_id,
+            "$USERNAME": lambda: user_id.replace("-", " ").title(),
+            "$TOKEN": lambda: self.token(user_id),
+            "$COURSE": lambda: self.rng.choice(COURSES),
+            "$SOFTSKILL": lambda: self.rng.choice(SOFTSKILLS),
+            "$TECHNICAL": lambda: self.rng.choice(TECHNICAL),
+            "$ACTIVITY": lambda: self.rng.choice(ACTIVITIES),
+        }
+        for placeholder, make in replacements.items():
+            while placeholder in value:
+                value = value.replace(placeholder, make(), 1)
+        return value
+
+    def request(self, record):
+        user_id = f"user-{self.rng.randrange(self.users)}"
+        return (
+            record["method"],
+            self.fill(record["path"], user_id),
+            self.fill(record.get("json"), user_id),
+        )
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+async def worker(client, records, weights, filler, deadline, results, interval):
+    while time.perf_counter() < deadline:
+        record = filler.rng.choices(records, weights)[0]
+        method, path, body = filler.request(record)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        results[record["name"]].append((time.perf_counter() - started, ok))
+        if interval:
+            await asyncio.sleep(max(interval - (time.perf_counter() - started), 0))
+
+
+async def drive(app_url, args):
+    records, weights = load_traffic(args.traffic)
+    results = defaultdict(list)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=120) as client:
+        if args.warmup:
+            warm = defaultdict(list)
+            filler = Filler(random.Random(args.seed + 1), args.users)
+            await asyncio.gather(*[
+                worker(client, records, weights, filler, time.perf_counter() + args.warmup, warm, None)
+                for _ in range(args.concurrency)
+            ])
+        await client.get("/__bench__/loop_lag", params={"reset": "true"})
+
+        # Each worker gets its own RNG so the request sequence doesn't depend on scheduling
+        interval = args.concurrency / args.rate if args.rate else None
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*[
+            worker(client, records, weights, Filler(random.Random(args.seed * 1000 + i), args.users), deadline, results, interval)
+            for i in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+        loop_lag = {}
+        response = await client.get("/__bench__/loop_lag", params={"reset": "true"})
+        if response.status_code == 200:
+            loop_lag = response.json()
+    return build_report(results, elapsed, loop_lag, args)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, ok in samples if not ok),
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def build_report(results, elapsed, loop_lag, args):
+    every = [sample for samples in results.values() for sample in samples]
+    return {
+        "config": {
+            "traffic": os.path.relpath(args.traffic, ROOT),
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "seed": args.seed,
+        },
+        "elapsed": elapsed,
+        "total": summarize(every, elapsed),
+        "endpoints": {name: summarize(samples, elapsed) for name, samples in sorted(results.items())},
+        "loop_lag": loop_lag,
+    }
+
+
+def change(current, previous):
+    if not previous:
+        return ""
+    return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+
+def print_report(report, baseline=None):
+    baseline = baseline or {}
+    base_endpoints = baseline.get("endpoints", {})
+    print(f"{'endpoint':<24}{'reqs':>8}{'err':>6}{'rps':>16}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}")
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for name, stats in rows:
+        base = baseline.get("total", {}) if name == "TOTAL" else base_endpoints.get(name, {})
+        print(
+            f"{name:<24}{stats['requests']:>8}{stats['errors']:>6}"
+            f"{stats['rps']:>9.1f}{change(stats['rps'], base.get('rps')):>7}"
+            f"{stats['p50_ms']:>11.1f}{change(stats['p50_ms'], base.get('p50_ms')):>7}"
+            f"{stats['p95_ms']:>11.1f}{change(stats['p95_ms'], base.get('p95_ms')):>7}"
+            f"{stats['p99_ms']:>11.1f}{change(stats['p99_ms'], base.get('p99_ms')):>7}"
+        )
+    lag = report.get("loop_lag") or {}
+    if lag.get("samples"):
+        base_lag = baseline.get("loop_lag") or {}
+        print(
+            f"event-loop lag: mean {lag['mean_ms']:.2f} ms{change(lag['mean_ms'], base_lag.get('mean_ms'))}, "
+            f"p99 {lag['p99_ms']:.2f} ms{change(lag['p99_ms'], base_lag.get('p99_ms'))}, max {lag['max_ms']:.2f} ms"
+        )
+
+
+def spawn(command, env):
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def wait_ready(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited early:\n{process.stderr.read().decode()}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def start_stack(args):
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    groq_url = f"http://127.0.0.1:{args.port_base}"
+    supabase_url = f"http://127.0.0.1:{args.port_base + 1}"
+    app_url = f"http://127.0.0.1:{args.port_base + 2}"
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    processes = [
+        spawn(uvicorn + ["--port", str(args.port_base), "bench.fake_groq:app"], env),
+        spawn(uvicorn + ["--port", str(args.port_base + 1), "bench.fake_supabase:app"], {**env, "FAKE_DB_USERS": str(args.users)}),
+    ]
+    wait_ready(f"{groq_url}/stats", processes[0])
+    wait_ready(f"{supabase_url}/stats", processes[1])
+    app_env = {
+        **env,
+        "GROQ_BASE_URL": groq_url,
+        "GROQ_API_KEY": "bench",
+        "API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{groq_url}/v1",
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_ANON_KEY": ANON_KEY,
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "CONTENT_CACHE_PATH": "",
+    }
+    processes.append(spawn([sys.executable, "bench/serve_app.py", "--port", str(args.port_base + 2)], app_env))
+    wait_ready(f"{app_url}/openapi.json", processes[2])
+    return app_url, processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traffic", default=os.path.join(ROOT, "bench", "traffic.jsonl"))
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, help="target total requests per second (default: as fast as possible)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port-base", type=int, default=9101)
+    parser.add_argument("--app-url", help="use a running app instead of spawning the fakes and the app")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        if args.app_url:
+            app_url = args.app_url
+        else:
+            app_url, processes = start_stack(args)
+        report = asyncio.run(drive(app_url, args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
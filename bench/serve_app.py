@@ -0,0 +1,68 @@
+"""Runs main:app under uvicorn with an event-loop lag probe for load tests.
+
+The probe sleeps for a fixed interval on the app's own loop and records how
+late it wakes up. GET /__bench__/loop_lag returns the samples gathered since
+the last call with ?reset=true.
+
+    python bench/serve_app.py --port 8003
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import deque
+from contextlib import asynccontextmanager
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+lag_samples = deque(maxlen=100_000)
+
+
+async def probe_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lag_samples.append(max(loop.time() - started - PROBE_INTERVAL, 0.0))
+
+
+@asynccontextmanager
+async def bench_lifespan(app):
+    async with main.lifespan(app):
+        probe = asyncio.create_task(probe_loop_lag())
+        try:
+            yield
+        finally:
+            probe.cancel()
+
+
+@main.app.get("/__bench__/loop_lag", include_in_schema=False)
+async def loop_lag(reset: bool = False):
+    samples = sorted(lag_samples)
+    if reset:
+        lag_samples.clear()
+    if not samples:
+        return {"samples": 0}
+    return {
+        "samples": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p99_ms": samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+main.app.router.lifespan_context = bench_lifespan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8003)
+    args = parser.parse_args()
+    uvicorn.run(main.app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,190 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+
+from cache import BUSY_TIMEOUT, SETUP_TIMEOUT, busy_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class BulkJobStore:
+    """Bulk recommendation jobs, their input records and results, in SQLite.
+
+    Records are written as the upload is read and results as each one
+    finishes, so nothing about a job has to be held in memory and a client
+    that lost its connection can pick the job up again by ID. Recommendation
+    templates are kept per job by fingerprint so identical inputs in a batch
+    are only generated once. Jobs expire ttl seconds after creation: job()
+    stops returning them at once, and their rows are deleted by purge(),
+    which runs when the file is opened and then at most every
+    purge_interval seconds as new jobs are created. A job whose lease is
+    still held is left for a later purge.
+
+    A connection working on a job holds a lease on it, renewed while it
+    runs, so no other connection (or worker process) works on it at the
+    same time; the lease lapses if its holder dies without releasing it.
+    """
+
+    def __init__(self, path=None, ttl=24 * 3600, purge_interval=600):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._conn = None
+        self._purged_at = 0.0
+
+    @property
+    def _db(self):
+        # Opened on first use; WAL so every worker process can use the same file
+        if self._conn is None:
+            conn = sqlite3.connect(self.path or ":memory:", timeout=SETUP_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS bulk_jobs
+                    (id TEXT PRIMARY KEY, created_at REAL NOT NULL, total INTEGER);
+                CREATE TABLE IF NOT EXISTS bulk_records
+                    (job_id TEXT, idx INTEGER, fingerprint TEXT, input TEXT NOT NULL,
+                     PRIMARY KEY (job_id, idx));
+                CREATE TABLE IF NOT EXISTS bulk_results
+                    (job_id TEXT, idx INTEGER, result TEXT NOT NULL, PRIMARY KEY (job_id, idx));
+                CREATE TABLE IF NOT EXISTS bulk_templates
+                    (job_id TEXT, fingerprint TEXT, template TEXT NOT NULL,
+                     PRIMARY KEY (job_id, fingerprint));
+                CREATE TABLE IF NOT EXISTS bulk_leases
+                    (job_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+                """
+            )
+            self._conn = conn
+            self.purge()
+            busy_timeout(conn, BUSY_TIMEOUT)
+        return self._conn
+
+    def purge(self):
+        now = time.time()
+        expired = [row[0] for row in self._db.execute(
+            "SELECT id FROM bulk_jobs WHERE created_at < ? "
+            "AND id NOT IN (SELECT job_id FROM bulk_leases WHERE expires_at >= ?)",
+            (now - self.ttl, now),
+        )]
+        self._purged_at = now
+        with self._db as db:
+            for job_id in expired:
+                for table in ("bulk_records", "bulk_results", "bulk_templates", "bulk_leases"):
+                    db.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+                db.execute("DELETE FROM bulk_jobs WHERE id = ?", (job_id,))
+
+    def create_job(self):
+        if time.time() - self._purged_at > self.purge_interval:
+            try:
+                self.purge()
+            except sqlite3.OperationalError as e:
+                # Another worker is writing; the next job will try again
+                logger.warning("Bulk job purge skipped: %s", e)
+        job_id = uuid.uuid4().hex
+        with self._db as db:
+            db.execute("INSERT INTO bulk_jobs (id, created_at) VALUES (?, ?)", (job_id, time.time()))
+        return job_id
+
+    def add_records(self, job_id, records):
+        # records: (index, fingerprint, input JSON)
+        with self._db as db:
+            db.executemany(
+                "INSERT INTO bulk_records (job_id, idx, fingerprint, input) VALUES (?, ?, ?, ?)",
+                [(job_id, *record) for record in records],
+            )
+
+    def finish_upload(self, job_id, total):
+        with self._db as db:
+            db.execute("UPDATE bulk_jobs SET total = ? WHERE id = ?", (total, job_id))
+
+    def acquire(self, job_id, owner, ttl):
+        # Taken only if nobody holds the job or their lease has run out
+        now = time.time()
+        with self._db as db:
+            cursor = db.execute(
+                "INSERT INTO bulk_leases (job_id, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (job_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE bulk_leases.expires_at < ?",
+                (job_id, owner, now + ttl, now),
+            )
+        return cursor.rowcount == 1
+
+    def renew(self, job_id, owner, ttl):
+        with self._db as db:
+            cursor = db.execute(
+                "UPDATE bulk_leases SET expires_at = ? WHERE job_id = ? AND owner = ?",
+                (time.time() + ttl, job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, job_id, owner):
+        with self._db as db:
+            db.execute("DELETE FROM bulk_leases WHERE job_id = ? AND owner = ?", (job_id, owner))
+
+    def job(self, job_id):
+        row = self._db.execute(
+            "SELECT total FROM bulk_jobs WHERE id = ? AND created_at >= ?", (job_id, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        completed = self._db.execute(
+            "SELECT COUNT(*) FROM bulk_results WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        return {"job_id": job_id, "total": row[0], "completed": completed}
+
+    def add_result(self, job_id, index, result):
+        with self._db as db:
+            db.execute(
+                "INSERT OR REPLACE INTO bulk_results (job_id, idx, result) VALUES (?, ?, ?)",
+                (job_id, index, json.dumps(result)),
+            )
+
+    def results(self, job_id, page_size=500):
+        after = -1
+        while True:
+            rows = self._db.execute(
+                "SELECT idx, result FROM bulk_results WHERE job_id = ? AND idx > ? ORDER BY idx LIMIT ?",
+                (job_id, after, page_size),
+            ).fetchall()
+            for index, result in rows:
+                yield json.loads(result)
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
+
+    def pending(self, job_id, page_size=100):
+        # Records without a result yet, in upload order, read a page at a time
+        after = -1
+        while True:
+            rows = self._db.execute(
+                "SELECT r.idx, r.fingerprint, r.input FROM bulk_records r "
+                "LEFT JOIN bulk_results s ON s.job_id = r.job_id AND s.idx = r.idx "
+                "WHERE r.job_id = ? AND r.idx > ? AND s.idx IS NULL ORDER BY r.idx LIMIT ?",
+                (job_id, after, page_size),
+            ).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
+
+    def template(self, job_id, fingerprint):
+        row = self._db.execute(
+            "SELECT template FROM bulk_templates WHERE job_id = ? AND fingerprint = ?",
+            (job_id, fingerprint),
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def set_template(self, job_id, fingerprint, template):
+        with self._db as db:
+            db.execute(
+                "INSERT OR REPLACE INTO bulk_templates (job_id, fingerprint, template) VALUES (?, ?, ?)",
+                (job_id, fingerprint, template),
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds a statement waits for another process's write lock. Lookups and
+# fills run on the event loop, so they give up quickly and count as a miss or
+# an unpersisted fill; opening the file and invalidations can't be skipped
+# and wait longer.
+BUSY_TIMEOUT = 0.1
+SETUP_TIMEOUT = 5.0
+
+# Key versions are kept this long after their last delete(), well past any
+# fill that could still be in flight from before it
+VERSION_RETENTION = 3600
+
+
+def busy_timeout(db, seconds):
+    db.execute(f"PRAGMA busy_timeout = {int(seconds * 1000)}")
+
+
+class ContentCache:
+    """In-memory LRU with a TTL, optionally backed by a SQLite file.
+
+    Values must be JSON serialisable when a path is given, since that is how
+    they are written to disk. Concurrent misses for the same key share a single
+    call to the factory passed to get_or_create.
+
+    Several caches (and several worker processes) can share one file, each in
+    its own table; the file is opened in WAL mode on first use. Since another
+    process may change or delete a row, local_ttl bounds how long the
+    in-memory copy is trusted before the file is read again (None: until the
+    entry expires, 0: always read the file). delete() bumps the key's version
+    in the file, and a fill only writes its value if the version it read
+    before calling the factory is still current, so a fill that raced an
+    invalidation in another process can't store the stale value.
+
+    The file is swept when opened and then every sweep_interval seconds as
+    values are stored: expired rows go, then the soonest-expiring ones above
+    max_rows (default ten times maxsize).
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, path=None, table="content", local_ttl=None,
+                 max_rows=None, sweep_interval=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.table = table
+        self.local_ttl = local_ttl
+        self.max_rows = max_rows if max_rows is not None else maxsize * 10
+        self.sweep_interval = sweep_interval
+        self._swept_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._inflight = {}
+        # Bumped by delete() so a fill that started before an invalidation
+        # doesn't write its now-stale value back
+        self._invalidations = 0
+        self._conn = None
+
+    @property
+    def _db(self):
+        # Opened lazily so importing the app (or forking workers) doesn't touch the file
+        if self._conn is None and self.path:
+            conn = sqlite3.connect(self.path, timeout=SETUP_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+                )
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.table}_expires_at ON {self.table} (expires_at)"
+                )
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table}_versions "
+                    "(key TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+                )
+            self._conn = conn
+            self._maybe_sweep()
+            busy_timeout(conn, BUSY_TIMEOUT)
+        return self._conn
+
+    def _maybe_sweep(self):
+        if time.time() - self._swept_at <= self.sweep_interval:
+            return
+        try:
+            self.sweep()
+        except sqlite3.OperationalError as e:
+            # Another process holds the write lock; the next store tries again
+            logger.warning("Cache %s sweep skipped: %s", self.table, e)
+
+    def sweep(self):
+        db = self._db
+        if db is None:
+            return
+        now = time.time()
+        self._swept_at = now
+        with db:
+            db.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+            db.execute(f"DELETE FROM {self.table}_versions WHERE updated_at < ?", (now - VERSION_RETENTION,))
+            excess = db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_rows
+            if excess > 0:
+                db.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)",
+                    (excess,),
+                )
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        now = time.time()
+        db = self._db
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value, fresh_until = entry
+            if (expires_at is None or expires_at > now) and (db is None or fresh_until is None or fresh_until > now):
+                self._data.move_to_end(key)
+                return entry
+            del self._data[key]
+        if db is None:
+            return None
+        try:
+            row = db.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            logger.warning("Cache %s lookup skipped: %s", self.table, e)
+            return None
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            # Also removed when the file is next opened, so a busy database can skip it
+            try:
+                with db:
+                    db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            except sqlite3.OperationalError:
+                pass
+            return None
+        return self._remember(key, expires_at, json.loads(value))
+
+    def _remember(self, key, expires_at, value):
+        fresh_until = time.time() + self.local_ttl if self.local_ttl is not None else None
+        entry = (expires_at, value, fresh_until)
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def _version(self, key):
+        db = self._db
+        if db is None:
+            return None
+        try:
+            row = db.execute(f"SELECT version FROM {self.table}_versions WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError as e:
+            logger.warning("Cache %s version read skipped: %s", self.table, e)
+            # Matches no version, so the fill isn't stored
+            return -1
+        return row[0] if row is not None else 0
+
+    def set(self, key, value, ttl=None, version=None):
+        # With a version, only stored if no delete() has happened since it was read
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        db = self._db
+        if db is not None:
+            try:
+                with db:
+                    if version is None:
+                        cursor = db.execute(
+                            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                            (key, json.dumps(value), expires_at),
+                        )
+                    else:
+                        cursor = db.execute(
+                            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) SELECT ?, ?, ? "
+                            f"WHERE COALESCE((SELECT version FROM {self.table}_versions WHERE key = ?), 0) = ?",
+                            (key, json.dumps(value), expires_at, key, version),
+                        )
+                if cursor.rowcount == 0:
+                    return
+            except sqlite3.OperationalError as e:
+                # Still cached in this process; other workers fill it themselves
+                logger.warning("Cache %s write skipped: %s", self.table, e)
+            self._maybe_sweep()
+        self._remember(key, expires_at, value)
+
+    def add(self, key, value, ttl=None):
+        # Stores value only if the key is missing or expired in every process
+        # sharing the file; True when this call stored it
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        db = self._db
+        if db is None:
+            if self._lookup(key) is not None:
+                return False
+        else:
+            busy_timeout(db, SETUP_TIMEOUT)
+            try:
+                with db:
+                    db.execute(
+                        f"DELETE FROM {self.table} WHERE key = ? AND expires_at IS NOT NULL AND expires_at < ?",
+                        (key, time.time()),
+                    )
+                    cursor = db.execute(
+                        f"INSERT OR IGNORE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires_at),
+                    )
+            finally:
+                busy_timeout(db, BUSY_TIMEOUT)
+            if cursor.rowcount == 0:
+                return False
+        self._remember(key, expires_at, value)
+        return True
+
+    def delete(self, key):
+        self._invalidations += 1
+        self._inflight.pop(key, None)
+        self._data.pop(key, None)
+        db = self._db
+        if db is not None:
+            # A skipped invalidation would leave other workers serving stale data
+            busy_timeout(db, SETUP_TIMEOUT)
+            try:
+                with db:
+                    db.execute(
+                        f"INSERT INTO {self.table}_versions (key, version, updated_at) VALUES (?, 1, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                        (key, time.time()),
+                    )
+                    db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            finally:
+                busy_timeout(db, BUSY_TIMEOUT)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    async def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, factory))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        # Shielded so a caller that goes away doesn't cancel the upstream call
+        # other callers are waiting on.
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, factory):
+        invalidations = self._invalidations
+        version = self._version(key)
+        value = await factory()
+        if invalidations == self._invalidations:
+            self.set(key, value, version=version)
+        return value
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,3 +1,4 @@
+from typing import Any, List, Optional
 from pydantic import BaseModel
 class TokenData(BaseModel):
     accessToken: str
@@ -34,4 +35,32 @@ class Career(BaseModel):
 class profiles(BaseModel):
     User_id: str
     highestEducationLevel: str
-    who_are_you: str
\ No newline at end of file
+    who_are_you: str
+class CareerProfileRequest(BaseModel):
+    career_name: str
+    sections: Optional[List[str]] = None
+    stream: bool = False
+
+class SoftSkills(BaseModel):
+    softskill1: str
+    softskill2: str
+    softskill3: str
+
+class TechnicalSkillSet(BaseModel):
+    technical1: str
+    technical2: str
+    technical3: str
+
+class CareerChoices(BaseModel):
+    career1: str
+    career2: str
+    career3: str
+
+class Onboarding(BaseModel):
+    userId: str
+    highestEducationLevel: Optional[str] = None
+    who_are_you: Optional[str] = None
+    activities: Optional[Any] = None
+    softskills: Optional[SoftSkills] = None
+    technicalSkills: Optional[TechnicalSkillSet] = None
+    careers: Optional[CareerChoices] = None
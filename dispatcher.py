@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+
+import metrics
+
+# Lower runs first
+INTERACTIVE = 0
+DETAIL = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", DETAIL: "detail", BACKGROUND: "background"}
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def is_retryable(error):
+    # Works for both the groq and openai SDKs, which share their error classes' shape
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class Overloaded(Exception):
+    """Raised when a call can't be admitted; the handler turns it into a 429."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def available(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.level
+
+    def take(self, amount):
+        self.available()
+        # Allowed to go negative when a call used more than was estimated
+        self.level -= amount
+
+    def wait_time(self, amount):
+        missing = min(amount, self.capacity) - self.available()
+        return max(missing / self.rate, 0.0)
+
+
+class Ticket:
+    def __init__(self, dispatcher, estimated_tokens):
+        self.dispatcher = dispatcher
+        self.estimated_tokens = estimated_tokens
+
+    def report_usage(self, total_tokens):
+        # Correct the token budget once the provider says what the call really cost
+        if self.dispatcher.tokens is not None and total_tokens:
+            self.dispatcher.tokens.take(total_tokens - self.estimated_tokens)
+            self.estimated_tokens = total_tokens
+
+
+class LLMDispatcher:
+    """Admission control for LLM calls.
+
+    At most max_concurrency calls run at once, and with requests_per_minute /
+    tokens_per_minute set, calls also wait for budget (0 means unlimited).
+    Waiting calls are served by priority, then arrival. A call is shed with
+    Overloaded when max_queue calls are already waiting or it has waited
+    max_wait seconds. Callers retry rate-limit, connection and 5xx errors
+    after backoff_delay(), a jittered exponential backoff; a provider 429
+    also pauses admission for its Retry-After so the other queued calls
+    don't hit it too.
+    """
+
+    def __init__(self, name="groq", max_concurrency=16, max_queue=100, max_wait=30.0,
+                 requests_per_minute=0, tokens_per_minute=0, max_retries=3,
+                 backoff=0.5, max_backoff=10.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._timer = None
+
+    def __len__(self):
+        return len(self._waiters)
+
+    def _delay(self, tokens):
+        # Seconds until a call of this size could start, ignoring concurrency
+        delay = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            delay = max(delay, self.requests.wait_time(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.wait_time(tokens))
+        return max(delay, 0.0)
+
+    def _can_start(self, tokens):
+        return self.active < self.max_concurrency and self._delay(tokens) == 0.0
+
+    def _start(self, tokens):
+        self.active += 1
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def release(self):
+        self.active -= 1
+        self._pump()
+
+    def _pump(self):
+        while self._waiters:
+            priority, _, tokens, waiter = self._waiters[0]
+            if waiter.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.active >= self.max_concurrency:
+                break
+            delay = self._delay(tokens)
+            if delay > 0:
+                self._schedule(delay)
+                break
+            heapq.heappop(self._waiters)
+            self._start(tokens)
+            waiter.set_result(None)
+        metrics.LLM_QUEUE_DEPTH.labels(self.name).set(len(self._waiters))
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._pump)
+
+    def retry_after(self):
+        queued_tokens = sum(entry[2] for entry in self._waiters)
+        seconds = self._delay(queued_tokens)
+        if self.requests is not None:
+            seconds = max(seconds, (len(self._waiters) + 1) / self.requests.rate)
+        return max(1, math.ceil(min(seconds, self.max_wait)))
+
+    def admit_check(self, priority=INTERACTIVE):
+        # Cheap early rejection for callers that can't surface Overloaded later,
+        # e.g. a streaming response that has already sent its headers
+        if len(self._waiters) >= self.max_queue:
+            metrics.LLM_SHED.labels(self.name, PRIORITY_NAMES.get(priority, str(priority))).inc()
+            raise Overloaded(self.retry_after())
+
+    async def acquire(self, priority, tokens):
+        label = PRIORITY_NAMES.get(priority, str(priority))
+        if not self._waiters and self._can_start(tokens):
+            self._start(tokens)
+            metrics.LLM_QUEUE_WAIT.labels(self.name, label).observe(0.0)
+            return
+        self.admit_check(priority)
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), tokens, waiter))
+        metrics.LLM_QUEUE_DEPTH.labels(self.name).set(len(self._waiters))
+        started = time.monotonic()
+        self._pump()
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            metrics.LLM_SHED.labels(self.name, label).inc()
+            raise Overloaded(self.retry_after())
+        metrics.LLM_QUEUE_WAIT.labels(self.name, label).observe(time.monotonic() - started)
+
+    def _abandon(self, waiter):
+        if waiter.done() and not waiter.cancelled():
+            # Granted just as the caller gave up: hand the slot back
+            self.release()
+            return
+        waiter.cancel()
+        self._waiters = [entry for entry in self._waiters if entry[3] is not waiter]
+        heapq.heapify(self._waiters)
+        self._pump()
+
+    def is_idle(self):
+        # Nothing queued and a free slot: a hedge sent here won't wait
+        return not self._waiters and self.active < self.max_concurrency
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def backoff_delay(self, attempt, error):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        if is_rate_limited(error):
+            self.pause(delay)
+        return delay
@@ -0,0 +1,44 @@
+"""gunicorn settings for serving the API with several uvicorn worker processes.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+WEB_CONCURRENCY sets the number of workers (default: one per CPU) and BIND the
+address. Set PROMETHEUS_MULTIPROC_DIR so /metrics adds up every worker.
+
+Each worker has its own LLM dispatcher, so the account-wide LLM limits
+(LLM_MAX_CONCURRENCY, *_REQUESTS_PER_MINUTE, *_TOKENS_PER_MINUTE) are split
+evenly between the workers, and WRITE_BEHIND=1 is refused with more than one.
+"""
+import multiprocessing
+import os
+import shutil
+
+# uvicorn's worker runs on uvloop with the httptools parser when they are
+# installed (both are pinned in requirement.txt), else the asyncio/h11 fallbacks
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("BIND", "0.0.0.0:8003")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Each worker imports the app and builds its clients in the lifespan hook, so
+# no sockets, SQLite handles or event loops are inherited across the fork
+preload_app = False
+keepalive = 5
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+# Time for open streams to finish and the write-behind queue to flush
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # Workers inherit this and size their share of the LLM limits by it
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
+    # Metric files left by a previous run would otherwise be summed in
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
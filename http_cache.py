@@ -0,0 +1,59 @@
+import gzip
+import hashlib
+
+import orjson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first when a client accepts several
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Parse an Accept-Encoding header into {coding: q}."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class EncodedResponse:
+    """A JSON body serialized once and compressed once per content coding.
+
+    Every coding is its own representation, so each gets its own strong ETag
+    (the hash of the JSON plus a suffix); the bytes are identical in every
+    worker, so the tags are too.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        body = orjson.dumps(content)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body)
+        self.etags = {
+            coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"' for coding in self.bodies
+        }
+
+    def negotiate(self, accept_encoding: str) -> str:
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ENCODINGS:
+            if accepted.get(coding, accepted.get("*", 0)) > 0:
+                return coding
+        return "identity"
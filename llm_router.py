@@ -0,0 +1,414 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+import anyio
+
+import metrics
+from dispatcher import DETAIL, LLMDispatcher, Ticket, estimate_tokens, is_rate_limited, is_retryable
+
+logger = logging.getLogger(__name__)
+
+# Room left in the token budget for the answer when estimating a call's cost
+EXPECTED_COMPLETION_TOKENS = 300
+
+
+class ProviderUnavailable(Exception):
+    """Raised when every provider configured for a route has its circuit open."""
+
+
+class CircuitBreaker:
+    """Stops sending traffic to a provider that keeps failing or stalling.
+
+    The last `window` calls are kept; once at least min_calls of them are in
+    and the share that errored or took longer than slow_call_seconds reaches
+    error_rate, the circuit opens for `cooldown` seconds. After that a single
+    probe call is let through: success closes the circuit, failure reopens it.
+    Only "ok" and "error" outcomes count; cancelled, retried and rate-limited
+    calls say nothing about the provider's health unless they were slow.
+    """
+
+    def __init__(self, name, window=20, min_calls=5, error_rate=0.5, slow_call_seconds=30.0, cooldown=30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._calls = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_after(self):
+        return max(self._opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def available(self):
+        return self.state == "closed" or (not self._probing and self.retry_after() == 0.0)
+
+    def allow(self):
+        # Call right before sending; in the half-open state this claims the probe
+        if self.state == "closed":
+            return True
+        if self._probing or self.retry_after() > 0:
+            return False
+        self.state = "half_open"
+        self._probing = True
+        return True
+
+    def release(self):
+        # The probe was shed or cancelled before it was sent, so it says nothing
+        # about the provider; the next call gets to probe instead
+        self._probing = False
+
+    def record(self, outcome, seconds):
+        slow = seconds >= self.slow_call_seconds
+        if outcome not in ("ok", "error") and not slow:
+            # Lost a hedge race, the client left, or our own rate budget ran out
+            if self._probing:
+                self._probing = False
+            return
+        failed = outcome == "error" or slow
+        if self.state != "closed":
+            self._probing = False
+            if failed:
+                self._open()
+            else:
+                self.state = "closed"
+                self._calls.clear()
+                metrics.LLM_CIRCUIT_OPEN.labels(self.name).set(0)
+            return
+        self._calls.append(failed)
+        if len(self._calls) >= self.min_calls and sum(self._calls) / len(self._calls) >= self.error_rate:
+            self._open()
+
+    def _open(self):
+        if self.state == "closed":
+            logger.error("Circuit opened for LLM provider %s", self.name)
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        metrics.LLM_CIRCUIT_OPEN.labels(self.name).set(1)
+
+
+class LatencyTracker:
+    """Recent time-to-first-token samples for one provider/model pair."""
+
+    def __init__(self, percentile=0.95, default_delay=3.0, min_delay=0.5, max_delay=15.0, min_samples=20, size=100):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def hedge_delay(self):
+        if len(self._samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self._samples)
+        observed = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+        return min(max(observed, self.min_delay), self.max_delay)
+
+
+class Provider:
+    def __init__(self, name, config, breaker_config):
+        self.name = name
+        self.type = config["type"]
+        self.config = config
+        self.client = None
+        # Concurrency and rate limits are for the whole account, but every worker
+        # process has its own dispatcher, so each one enforces an equal share
+        workers = max(int(os.environ.get("WEB_CONCURRENCY", 1)), 1)
+        max_concurrency = int(config.get("max_concurrency", os.environ.get("LLM_MAX_CONCURRENCY", 16)))
+        requests_per_minute = int(os.environ.get(f"{name.upper()}_REQUESTS_PER_MINUTE", config.get("requests_per_minute", 0)))
+        tokens_per_minute = int(os.environ.get(f"{name.upper()}_TOKENS_PER_MINUTE", config.get("tokens_per_minute", 0)))
+        self.dispatcher = LLMDispatcher(
+            name=name,
+            max_concurrency=max(max_concurrency // workers, 1),
+            max_queue=int(config.get("max_queue", os.environ.get("LLM_MAX_QUEUE", 100))),
+            max_wait=float(config.get("max_wait", os.environ.get("LLM_MAX_WAIT", 30))),
+            requests_per_minute=requests_per_minute / workers,
+            tokens_per_minute=tokens_per_minute / workers,
+            max_retries=int(config.get("max_retries", os.environ.get("LLM_MAX_RETRIES", 3))),
+        )
+        self.breaker = CircuitBreaker(name, **breaker_config)
+
+    def start(self, http_client):
+        api_key = os.environ.get(self.config["api_key_env"])
+        if not api_key:
+            logger.error("No %s set, LLM provider %s is disabled", self.config["api_key_env"], self.name)
+            return
+        base_url = os.environ.get(self.config.get("base_url_env", "")) or None
+        # Imported here so a deployment only loads the SDKs it actually uses.
+        # SDK retries are off: the dispatcher retries within the shared budget.
+        if self.type == "groq":
+            from groq import AsyncGroq
+            self.client = AsyncGroq(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        elif self.type == "openai":
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        else:
+            raise ValueError(f"Unknown LLM provider type {self.type!r}")
+
+    def ready(self):
+        return self.client is not None and self.breaker.available()
+
+    async def create_stream(self, model, messages, **kwargs):
+        if self.type == "openai":
+            # Groq reports usage in x_groq on the last chunk; OpenAI only when asked
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        return await self.client.chat.completions.create(messages=messages, model=model, stream=True, **kwargs)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+
+
+class Attempt:
+    """One streamed completion from one provider.
+
+    open() waits for admission and returns once the first token is in,
+    retrying provider errors until then. The dispatcher slot is held until
+    close(), which also records metrics and feeds the circuit breaker.
+    """
+
+    def __init__(self, provider, model, tracker, messages, priority, stream, kwargs):
+        self.provider = provider
+        self.model = model
+        self.tracker = tracker
+        self.messages = messages
+        self.priority = priority
+        self.stream = stream
+        self.kwargs = kwargs
+        self.estimated = (
+            sum(estimate_tokens(message["content"]) for message in messages)
+            + kwargs.get("max_tokens", EXPECTED_COMPLETION_TOKENS)
+        )
+        self.first = None
+        self.first_token = None
+        self.usage = None
+        self._started = None
+        self._upstream = None
+        self._chunks = None
+        self._ticket = None
+        self._active = False
+        # Set once a slot is granted; from then on close() reports to the breaker
+        self._admitted = False
+
+    async def open(self):
+        dispatcher = self.provider.dispatcher
+        for attempt in range(dispatcher.max_retries + 1):
+            await dispatcher.acquire(self.priority, self.estimated)
+            self._active = True
+            self._admitted = True
+            self._ticket = Ticket(dispatcher, self.estimated)
+            self._started = time.perf_counter()
+            self.first_token = None
+            self.usage = None
+            metrics.LLM_IN_FLIGHT.labels(self.provider.name).inc()
+            try:
+                self._upstream = await self.provider.create_stream(self.model, self.messages, **self.kwargs)
+                self._chunks = self._upstream.__aiter__()
+                self.first = await self._next_delta()
+                self.first_token = time.perf_counter() - self._started
+                self.tracker.add(self.first_token)
+                return self
+            except Exception as e:
+                retry = attempt < dispatcher.max_retries and is_retryable(e)
+                # A 429 is the dispatcher's to absorb, and a retried error only
+                # counts against the provider if the last attempt fails too
+                await self.close("rate_limited" if is_rate_limited(e) else "retried" if retry else "error")
+                if not retry:
+                    raise
+                delay = dispatcher.backoff_delay(attempt, e)
+                metrics.LLM_RETRIES.labels(self.provider.name, type(e).__name__).inc()
+            except BaseException:
+                await self.close("cancelled")
+                raise
+            await asyncio.sleep(delay)
+
+    async def _next_delta(self):
+        while True:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return None
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None:
+                self.usage = usage
+                self._ticket.report_usage(usage.total_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                return chunk.choices[0].delta.content
+
+    async def deltas(self):
+        delta = self.first
+        while delta is not None:
+            yield delta
+            delta = await self._next_delta()
+
+    async def text(self):
+        outcome = "cancelled"
+        try:
+            text = "".join([delta async for delta in self.deltas()])
+            outcome = "ok"
+            return text
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            await self.close(outcome)
+
+    async def close(self, outcome):
+        if not self._active:
+            return
+        self._active = False
+        try:
+            # Closing the upstream response stops generation we no longer need
+            if self._upstream is not None:
+                with anyio.CancelScope(shield=True):
+                    await self._upstream.close()
+        finally:
+            self._upstream = None
+            elapsed = time.perf_counter() - self._started
+            metrics.LLM_IN_FLIGHT.labels(self.provider.name).dec()
+            metrics.record_llm(self.provider.name, self.model, self._started, self.first_token, self.usage, self.stream, outcome)
+            self.provider.breaker.record(outcome, elapsed)
+            self.provider.dispatcher.release()
+
+
+class LLMRouter:
+    """Sends each route's prompts to its configured provider and model.
+
+    Routes name a primary target and optionally a hedge target. If the
+    primary hasn't produced a first token within its observed p95 (see
+    LatencyTracker), the same prompt is sent to the hedge as long as the
+    hedge provider has a free slot; whichever answers first is used and the
+    other is cancelled. A primary that fails outright also falls over to
+    the hedge. Providers whose circuit breaker is open are skipped.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        breaker_config = config.get("circuit_breaker", {})
+        self.hedging = config.get("hedging", {})
+        self.providers = {
+            name: Provider(name, provider, breaker_config) for name, provider in config["providers"].items()
+        }
+        self.routes = config["routes"]
+        self._trackers = {}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def start(self, http_client):
+        for provider in self.providers.values():
+            provider.start(http_client)
+
+    async def close(self):
+        for provider in self.providers.values():
+            await provider.close()
+
+    def model_for(self, route):
+        return self.routes[route]["primary"]["model"]
+
+    def _tracker(self, target):
+        key = (target["provider"], target["model"])
+        if key not in self._trackers:
+            self._trackers[key] = LatencyTracker(**self.hedging)
+        return self._trackers[key]
+
+    def _targets(self, route):
+        config = self.routes[route]
+        targets = [config["primary"]]
+        if config.get("hedge"):
+            targets.append(config["hedge"])
+        return [target for target in targets if self.providers[target["provider"]].ready()]
+
+    def admit_check(self, route, priority=DETAIL):
+        targets = self._targets(route)
+        if not targets:
+            raise ProviderUnavailable(f"No LLM provider available for {route}")
+        self.providers[targets[0]["provider"]].dispatcher.admit_check(priority)
+
+    def _attempt(self, target, messages, priority, stream, kwargs):
+        provider = self.providers[target["provider"]]
+        if not provider.breaker.allow():
+            return None
+        probe = provider.breaker.state == "half_open"
+        attempt = Attempt(provider, target["model"], self._tracker(target), messages, priority, stream, kwargs)
+        task = asyncio.ensure_future(attempt.open())
+        if probe:
+            def release_unsent(task):
+                # Shed with Overloaded or cancelled while queued (or before it
+                # even started): close() never runs, so hand the probe back here
+                if not attempt._admitted and (task.cancelled() or task.exception() is not None):
+                    provider.breaker.release()
+
+            task.add_done_callback(release_unsent)
+        return task
+
+    async def _race(self, route, messages, priority, stream, kwargs):
+        targets = self._targets(route)
+        primary = None
+        while targets and primary is None:
+            target = targets.pop(0)
+            primary = self._attempt(target, messages, priority, stream, kwargs)
+            delay = self._tracker(target).hedge_delay()
+        if primary is None:
+            raise ProviderUnavailable(f"No LLM provider available for {route}")
+        hedge_target = targets[0] if targets else None
+        hedge = None
+        pending = {primary}
+        errors = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=delay if hedge_target is not None else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                winners = [task for task in done if task.exception() is None]
+                errors.extend(task.exception() for task in done if task.exception() is not None)
+                if winners:
+                    if hedge is not None:
+                        metrics.LLM_HEDGES.labels(route, "hedge" if winners[0] is hedge else "primary").inc()
+                    for task in winners[1:]:
+                        await task.result().close("cancelled")
+                    await self._cancel(pending)
+                    return winners[0].result()
+                if hedge_target is not None:
+                    # The primary failed, or is past its p95 without a first token.
+                    # A slow primary is only hedged when the hedge won't have to queue.
+                    if errors or self.providers[hedge_target["provider"]].dispatcher.is_idle():
+                        hedge = self._attempt(hedge_target, messages, priority, stream, kwargs)
+                        if hedge is not None:
+                            pending.add(hedge)
+                    hedge_target = None
+            raise errors[0]
+        except BaseException:
+            await self._cancel(pending)
+            raise
+
+    @staticmethod
+    async def _cancel(tasks):
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except BaseException:
+                pass
+
+    async def open_stream(self, route, messages, priority=DETAIL, **kwargs):
+        # Caller iterates attempt.deltas() and must call attempt.close(outcome)
+        return await self._race(route, messages, priority, True, kwargs)
+
+    async def complete(self, route, messages, priority=DETAIL, **kwargs):
+        attempt = await self._race(route, messages, priority, False, kwargs)
+        return await attempt.text()
+
@@ -1,27 +1,121 @@
+import asyncio
+import csv
+import hashlib
+import io
 import logging
-from groq import Groq
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+import anyio
+import httpx
 from dotenv import load_dotenv  # Update this line
 load_dotenv()
-from fastapi import FastAPI, HTTPException
-from openai import OpenAI
+import json
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 import os
-from supabase import create_client
+from supabase._async.client import create_client
 import database
+from bulk import BulkJobStore
+from cache import ContentCache
+from http_cache import EncodedResponse
+from write_behind import WriteBehindQueue
+from ranking import RankingEngine
+from auth import TokenVerifier
+import dispatcher
+import prompts
+from dispatcher import Overloaded
+from llm_router import LLMRouter, ProviderUnavailable
+import metrics
+from metrics import MetricsMiddleware, timed_supabase, timing_logger
 from fastapi.middleware.cors import CORSMiddleware
 
 
-app = FastAPI()
 # Set up logging
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
-client = OpenAI(api_key=os.environ.get('API_KEY'))
-groq_client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
-)
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_ANON_KEY")
-supabase = create_client(url, key)
+
+# Every cache lives in one SQLite file (WAL mode), each in its own table, so
+# worker processes share what any of them has fetched or generated. Set
+# CONTENT_CACHE_PATH="" to keep the caches in memory instead.
+CACHE_PATH = os.environ.get("CONTENT_CACHE_PATH", "content_cache.db")
+
+# Worker processes serving the app; gunicorn.conf.py sets it, and uvicorn
+# --workers reads it as its default
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+# How long after one worker starts the warm-up the others skip theirs
+WARM_UP_LOCK_SECONDS = float(os.environ.get("WARM_UP_LOCK_SECONDS", 3600))
+
+# Created once in the lifespan hook below so every request shares the same
+# pooled connections instead of blocking the event loop on sync clients.
+supabase = None
+token_verifier: TokenVerifier = None
+# Set when WRITE_BEHIND=1: profile updates are acknowledged at once and written in batches
+profile_writes: WriteBehindQueue = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global supabase, token_verifier, profile_writes
+    if os.environ.get("WRITE_BEHIND") == "1" and WORKERS > 1:
+        # Queued writes are only visible to reads in the worker that took them
+        raise RuntimeError("WRITE_BEHIND=1 needs a single worker (WEB_CONCURRENCY=1)")
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(os.environ.get("GROQ_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.environ.get("GROQ_MAX_KEEPALIVE", 20)),
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+    llm_router.start(http_client)
+    supabase = await create_client(url, key)
+    token_verifier = TokenVerifier(
+        url,
+        jwt_secret=os.environ.get("SUPABASE_JWT_SECRET"),
+        http_client=http_client,
+        api_key=key,
+        jwks_refresh=float(os.environ.get("JWKS_REFRESH_SECONDS", 600)),
+        cache_path=CACHE_PATH,
+    )
+    metrics.register_cache("token", token_verifier.cache)
+    if os.environ.get("WRITE_BEHIND") == "1":
+        profile_writes = WriteBehindQueue(
+            flush_profile_writes,
+            interval=float(os.environ.get("WRITE_BEHIND_INTERVAL", 0.5)),
+            max_batch=int(os.environ.get("WRITE_BEHIND_BATCH", 100)),
+        )
+        profile_writes.start()
+    lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
+    warm_task = None
+    # Every worker starts with the same setting; only the one that claims the
+    # marker in the shared cache warms it, the others find the entries there
+    if os.environ.get("WARM_CONTENT_CACHE") == "1" and content_cache.add("warm-up", os.getpid(), ttl=WARM_UP_LOCK_SECONDS):
+        warm_task = asyncio.create_task(warm_content_cache())
+    try:
+        yield
+    finally:
+        lag_monitor.cancel()
+        if warm_task is not None:
+            warm_task.cancel()
+        if profile_writes is not None:
+            await profile_writes.close()
+        await llm_router.close()
+        await http_client.aclose()
+        await supabase.postgrest.aclose()
+        content_cache.close()
+        recommendation_cache.close()
+        user_info_cache.close()
+        token_verifier.cache.close()
+        bulk_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # Allow requests from http://localhost:8081
@@ -32,70 +126,389 @@ app.add_middleware(
     allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def prometheus_metrics():
+    content, media_type = metrics.metrics_response()
+    return Response(content=content, media_type=media_type)
+
+
+# Every LLM call goes through the router: it picks the provider and model per
+# route from llm_config.json, hedges slow calls and queues (eventually with a
+# 429) instead of tripping the providers' rate limits.
+llm_router = LLMRouter.load(os.environ.get("LLM_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_config.json")))
+
+
+def too_many_requests(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail="Too many requests, please retry later", headers={"Retry-After": str(e.retry_after)})
+
+RECOMMENDATION_MODEL = llm_router.model_for("recommendation")
+
+
+# Courses are ranked locally; the LLM only explains the top three it is given
+ranking_engine = RankingEngine.load(
+    os.environ.get("COURSE_AFFINITY_PATH", os.path.join(os.path.dirname(__file__), "course_affinity.json"))
+)
+RECOMMENDATION_TIMEOUT = float(os.environ.get("RECOMMENDATION_TIMEOUT", 20))
+
+
+def recommendation_prompt(body: database.UserInput, courses: list) -> prompts.Prompt:
+    return prompts.render(
+        "recommendation",
+        course1=courses[0], course2=courses[1], course3=courses[2],
+        **body.model_dump(),
+    )
+
+
+def recommended_courses(body: database.UserInput) -> list:
+    return [course for course, _ in ranking_engine.rank(body)]
+
+
+def fallback_recommendation(body: database.UserInput) -> str:
+    return ranking_engine.explain(body, ranking_engine.rank(body))
+
+
+# Recommendations are cached by what the user picked, not who they are: the
+# prompt has a placeholder where the name goes, filled in on the way out.
+recommendation_cache = ContentCache(
+    maxsize=int(os.environ.get("RECOMMENDATION_CACHE_SIZE", 2048)),
+    ttl=float(os.environ.get("RECOMMENDATION_CACHE_TTL", 24 * 3600)),
+    path=os.environ.get("RECOMMENDATION_CACHE_PATH", CACHE_PATH),
+    table="recommendation",
+)
+metrics.register_cache("recommendation", recommendation_cache)
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.split()).casefold()
+
+
+def recommendation_fingerprint(body: database.UserInput) -> str:
+    canonical = {
+        "model": RECOMMENDATION_MODEL,
+        # The answer explains these three, so a change to the ranking must miss
+        "courses": recommended_courses(body),
+        "prompt": prompts.TEMPLATES["recommendation"].text,
+        "task_activities": _normalize(body.task_activities),
+        "softskills": sorted(_normalize(v) for v in (body.softskill1, body.softskill2, body.softskill3)),
+        "technical": sorted(_normalize(v) for v in (body.technical1, body.technical2, body.technical3)),
+        "careers": sorted(_normalize(v) for v in (body.career1, body.career2, body.career3)),
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def personalize(text: str, username: str) -> str:
+    return text.replace(prompts.USERNAME_PLACEHOLDER, username.strip() or "you")
+
+
+def split_placeholder(text: str):
+    # Holds back a tail that may be the start of a placeholder split across deltas
+    for size in range(min(len(text), len(prompts.USERNAME_PLACEHOLDER) - 1), 0, -1):
+        if prompts.USERNAME_PLACEHOLDER.startswith(text[-size:]):
+            return text[:-size], text[-size:]
+    return text, ""
+
+
+async def recommendation_template(body: database.UserInput, no_cache: bool = False, priority: int = dispatcher.INTERACTIVE) -> str:
+    courses = recommended_courses(body)
+
+    async def generate():
+        prompt = recommendation_prompt(body, courses)
+        # The model writes a placeholder for the name, so this text is safe to share
+        return await llm_router.complete(
+            "recommendation", prompt.messages, priority=priority, max_tokens=prompt.max_tokens
+        )
+
+    key = recommendation_fingerprint(body)
+    if no_cache:
+        template = await generate()
+        recommendation_cache.set(key, template)
+        return template
+    return await recommendation_cache.get_or_create(key, generate)
+
+
+async def generate_recommendation(body: database.UserInput, no_cache: bool = False) -> str:
+    return personalize(await recommendation_template(body, no_cache), body.username)
+
 
 @app.post('/prompt')
-async def api(body: database.UserInput):
+async def api(body: database.UserInput, no_cache: bool = False):
+    courses = recommended_courses(body)
     try:
-        prompt_text = f"""
-        Generate personalized career choice recommendations strictly from the following list of courses:
-
- 1.⁠ ⁠Medicine and Surgery
- 2.⁠ ⁠Law
- 3.⁠ ⁠Civil Engineering
- 4.⁠ ⁠Mechanical Engineering
- 5.⁠ ⁠Electrical Engineering
- 6.⁠ ⁠Computer Science
- 7.⁠ ⁠Information Technology
- 8.⁠ ⁠Business Administration
- 9.⁠ ⁠Accounting
-10.⁠ ⁠Nursing and Nursing Science
-11.⁠ ⁠Agriculture
-12.⁠ ⁠Mass Communication
-13.⁠ ⁠Environmental Science
-14.⁠ ⁠Education
-15.⁠ ⁠Pharmacy
-
-Consider the user's favourite tasks, soft skills, and technical skills to provide the most suitable recommendations. The user details are as follows:
-
-Username: {body.username}
-Favorite Tasks/Activities:  {body.task_activities}
-
-Soft Skills:
-  1. {body.softskill1}
-  2. {body.softskill2}
-  3. {body.softskill3}
-
-Technical Skills:
-  1.  {body.technical1}
-  2. {body.technical2}
-  3. {body.technical3}
-
-Career choices:
- 1.⁠ ⁠{body.career1}
- 2.⁠ ⁠{body.career2}
- 3.⁠ ⁠{body.career3}
-
-Please analyze this information and recommend the top three most suitable courses from the given list. Additionally, provide a brief explanation for each recommendation, detailing why it aligns well with the username preferences and skills in 150 words only.
-        """
+        response = await asyncio.wait_for(generate_recommendation(body, no_cache), RECOMMENDATION_TIMEOUT)
+        return {"response": response, "courses": courses}
+    except Overloaded as e:
+        raise too_many_requests(e)
     except Exception as e:
-         print(e)
-         raise HTTPException(status_code=422, detail="Unprocessable Entity")
-    
+        # Slow or failing upstream: answer with the local ranking instead of a 500
+        print(repr(e))
+        return {"response": fallback_recommendation(body), "courses": courses, "fallback": True}
+
+
+# Bulk jobs: the upload is spooled to disk, its records and results live in
+# SQLite, and results stream back as they finish, so memory stays flat for any
+# upload size and a dropped client can resume with the job ID.
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", 4))
+BULK_MAX_RECORDS = int(os.environ.get("BULK_MAX_RECORDS", 10000))
+bulk_store = BulkJobStore(
+    path=os.environ.get("BULK_JOBS_PATH", "bulk_jobs.db"),
+    ttl=float(os.environ.get("BULK_JOB_TTL", 24 * 3600)),
+)
+# How long a job stays claimed by a connection that stopped renewing it
+BULK_LEASE_SECONDS = float(os.environ.get("BULK_LEASE_SECONDS", 60))
+
+
+def upload_rows(upload, format: str):
+    # JSONL lines are decoded by the caller so one bad line doesn't end the upload
+    text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        if line.strip():
+            yield line
+
+
+async def import_bulk_upload(job_id: str, upload, format: str) -> int:
+    total = 0
+    records = []
     try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
-    
+        for index, row in enumerate(upload_rows(upload, format)):
+            if index >= BULK_MAX_RECORDS:
+                raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_RECORDS} records per upload")
+            total = index + 1
+            try:
+                body = database.UserInput(**(json.loads(row) if isinstance(row, str) else row))
+            except Exception as e:
+                # Reported in the results like any other record instead of failing the batch
+                bulk_store.add_result(job_id, index, {"index": index, "error": str(e)})
+                continue
+            records.append((index, recommendation_fingerprint(body), body.model_dump_json()))
+            if len(records) >= 500:
+                bulk_store.add_records(job_id, records)
+                records = []
+                # Let other requests run between batches of a large upload
+                await asyncio.sleep(0)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the upload: {e}")
+    bulk_store.add_records(job_id, records)
+    bulk_store.finish_upload(job_id, total)
+    return total
+
+
+async def bulk_recommendation(job_id: str, index: int, fingerprint: str, body: database.UserInput) -> dict:
+    courses = recommended_courses(body)
+    # Identical inputs earlier in the batch already produced this template
+    template = bulk_store.template(job_id, fingerprint)
+    while template is None:
+        try:
+            # No RECOMMENDATION_TIMEOUT: background calls are expected to queue
+            # behind interactive traffic, and the dispatcher bounds the wait
+            template = await recommendation_template(body, priority=dispatcher.BACKGROUND)
+            bulk_store.set_template(job_id, fingerprint, template)
+        except Overloaded as e:
+            # Nobody is waiting on a single record, so wait for capacity instead of failing it
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            print(repr(e))
+            return {"index": index, "response": fallback_recommendation(body), "courses": courses, "fallback": True}
+    return {"index": index, "response": personalize(template, body.username), "courses": courses}
+
+
+def run_bulk_job(job_id: str) -> StreamingResponse:
+    # The lease lives in the job store, so a resume that lands on another
+    # worker process is turned away too
+    owner = uuid.uuid4().hex
+    if not bulk_store.acquire(job_id, owner, BULK_LEASE_SECONDS):
+        raise HTTPException(status_code=409, detail="Job is still running on another connection")
+
+    async def keep_lease():
+        while True:
+            await asyncio.sleep(BULK_LEASE_SECONDS / 3)
+            if not bulk_store.renew(job_id, owner, BULK_LEASE_SECONDS):
+                logger.error("Lost the lease on bulk job %s", job_id)
+
+    async def ndjson():
+        queue = asyncio.Queue(maxsize=BULK_CONCURRENCY * 2)
+        pending = bulk_store.pending(job_id)
+
+        async def work():
+            try:
+                for index, fingerprint, data in pending:
+                    result = await bulk_recommendation(job_id, index, fingerprint, database.UserInput.model_validate_json(data))
+                    # Fallbacks are streamed but not stored, so resuming the job retries them
+                    if not result.get("fallback"):
+                        bulk_store.add_result(job_id, index, result)
+                    await queue.put(result)
+            finally:
+                await queue.put(None)
+
+        workers = []
+        lease = asyncio.ensure_future(keep_lease())
+        try:
+            yield json.dumps(bulk_store.job(job_id)) + "\n"
+            # Results already stored: rejected rows, or everything done before a resume
+            for result in bulk_store.results(job_id):
+                yield json.dumps(result) + "\n"
+            workers = [asyncio.ensure_future(work()) for _ in range(BULK_CONCURRENCY)]
+            running = len(workers)
+            while running:
+                result = await queue.get()
+                if result is None:
+                    running -= 1
+                    continue
+                yield json.dumps(result) + "\n"
+            # A job that outlived BULK_JOB_TTL while running no longer has a summary
+            yield json.dumps({**(bulk_store.job(job_id) or {"job_id": job_id}), "done": True}) + "\n"
+        finally:
+            lease.cancel()
+            for worker in workers:
+                worker.cancel()
+            bulk_store.release(job_id, owner)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.post('/prompt/bulk')
+async def prompt_bulk(request: Request, format: Optional[str] = None):
+    content_type = request.headers.get("content-type", "")
+    upload = None
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            file = next((value for value in form.values() if not isinstance(value, str)), None)
+            if file is None:
+                raise HTTPException(status_code=400, detail="No file in the upload")
+            # Copied out because TextIOWrapper can't wrap the SpooledTemporaryFile
+            # behind UploadFile on Python 3.9 (it has no readable())
+            upload = tempfile.TemporaryFile()
+            while True:
+                chunk = await file.read(1 << 20)
+                if not chunk:
+                    break
+                upload.write(chunk)
+            await form.close()
+            content_type = file.content_type or ""
+            format = format or ("csv" if (file.filename or "").lower().endswith(".csv") else None)
+        else:
+            # Spooled to disk as it arrives rather than read into memory
+            upload = tempfile.TemporaryFile()
+            async for chunk in request.stream():
+                upload.write(chunk)
+        upload.seek(0)
+        format = format or ("csv" if "csv" in content_type else "jsonl")
+        if format not in ("csv", "jsonl"):
+            raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+        job_id = bulk_store.create_job()
+        await import_bulk_upload(job_id, upload, format)
+    finally:
+        if upload is not None:
+            upload.close()
+    return run_bulk_job(job_id)
+
+
+@app.get('/prompt/bulk/{job_id}')
+async def resume_prompt_bulk(job_id: str):
+    # Replays the results stored so far, then finishes the records still pending
+    if bulk_store.job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return run_bulk_job(job_id)
+
+
+@app.get('/cache_stats')
+async def cache_stats():
+    return {
+        "content": content_cache.stats(),
+        "recommendation": recommendation_cache.stats(),
+        "user_info": user_info_cache.stats(),
+    }
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post('/prompt/stream')
+async def prompt_stream(body: database.UserInput, request: Request, no_cache: bool = False):
+    prompt = recommendation_prompt(body, recommended_courses(body))
+    key = recommendation_fingerprint(body)
+    cached = None if no_cache else recommendation_cache.get(key)
+    if cached is None:
+        try:
+            llm_router.admit_check("recommendation", dispatcher.INTERACTIVE)
+        except Overloaded as e:
+            raise too_many_requests(e)
+        except ProviderUnavailable:
+            pass
+
+    async def events():
+        started = time.perf_counter()
+        first_token = None
+        generation = None
+        completed = False
+        parts = []
+        outcome = "cancelled"
+        try:
+            if cached is not None:
+                first_token = time.perf_counter() - started
+                completed = True
+                yield sse_event({"delta": personalize(cached, body.username)})
+                yield sse_event({}, event="done")
+                return
+            generation = await llm_router.open_stream(
+                "recommendation", prompt.messages, priority=dispatcher.INTERACTIVE, max_tokens=prompt.max_tokens
+            )
+            held = ""
+            async for delta in generation.deltas():
+                if await request.is_disconnected():
+                    break
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                parts.append(delta)
+                text, held = split_placeholder(held + delta)
+                if text:
+                    yield sse_event({"delta": personalize(text, body.username)})
+            else:
+                completed = True
+                outcome = "ok"
+                recommendation_cache.set(key, "".join(parts))
+                if held:
+                    yield sse_event({"delta": held})
+                yield sse_event({}, event="done")
+        except Overloaded as e:
+            yield sse_event({"detail": "Too many requests, please retry later", "retry_after": e.retry_after}, event="error")
+        except Exception as e:
+            print(e)
+            outcome = "error"
+            if parts:
+                yield sse_event({"detail": "Error communicating with Groq Api"}, event="error")
+            else:
+                yield sse_event({"delta": fallback_recommendation(body), "fallback": True})
+                yield sse_event({}, event="done")
+        finally:
+            # Closing the upstream response stops generation for clients that went away
+            if generation is not None:
+                with anyio.CancelScope(shield=True):
+                    await generation.close(outcome)
+            timing_logger.info(json.dumps({
+                "request_id": metrics.request_id_var.get(),
+                "route": "/prompt/stream",
+                "ttft_ms": round(first_token * 1000, 2) if first_token is not None else None,
+                "total_ms": round((time.perf_counter() - started) * 1000, 2),
+                "completed": completed,
+                "cached": cached is not None,
+                "provider": generation.provider.name if generation is not None else None,
+            }))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post('/addProfile')
 async def addProfile(body: dict):
     try:
@@ -103,12 +516,13 @@ async def addProfile(body: dict):
         name = body['name']
         email = body['email']
         photoURL = body['photo_url']
-        data, count = supabase.table('profiles').insert({
+        data, count = await timed_supabase('profiles', 'insert', supabase.table('profiles').insert({
             "id": userId, 
             "displayName": name,
             "email": email,
             "photoURL": photoURL
-        }).execute()
+        }).execute())
+        invalidate_user_info(userId)
         return {"message": "User created successfully", "data": data, "count": count}
     
     except Exception as e:
@@ -120,12 +534,18 @@ async def addProfile(body: dict):
 async def get_user_details(body: dict):
     try:
         jwt = body['accessToken']
-        data = supabase.auth.get_user(jwt)
+        claims = await token_verifier.verify(jwt)
+        if claims is None:
+            data = await timed_supabase('auth', 'get_user', supabase.auth.get_user(jwt))
+            claims = token_verifier.remember_remote(jwt, data.user) or {
+                "sub": data.user.id,
+                "user_metadata": data.user.user_metadata,
+            }
         user_data = {
-            "id": data.user.id,
-            "avatar_url": data.user.user_metadata['avatar_url'],
-            "email": data.user.user_metadata['email'],
-            "full_name": data.user.user_metadata['full_name']
+            "id": claims["sub"],
+            "avatar_url": claims["user_metadata"]['avatar_url'],
+            "email": claims["user_metadata"]['email'],
+            "full_name": claims["user_metadata"]['full_name']
         }
         
         return {"message": "Got user details Successfully", "data": user_data}
@@ -133,213 +553,285 @@ async def get_user_details(body: dict):
         print(e)
         raise HTTPException(status_code=500, detail="Error in getting user details")
 
+# The app polls /get_user_info on nearly every screen but the data only changes
+# through our own write endpoints, which drop the cached entry for that user.
+user_info_cache = ContentCache(
+    maxsize=int(os.environ.get("USER_INFO_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("USER_INFO_CACHE_TTL", 300)),
+    path=CACHE_PATH,
+    table="user_info",
+    # Another worker may have invalidated the entry, so always check the shared copy
+    local_ttl=0,
+)
+metrics.register_cache("user_info", user_info_cache)
+
+
+def invalidate_user_info(userId: str):
+    user_info_cache.delete(userId)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def user_info_response(data) -> dict:
+    body = json.dumps({"data": data}, default=str)
+    return {"body": body, "etag": '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'}
+
+
+async def load_user_info(userId: str) -> dict:
+    async def fetch():
+        response, count = await timed_supabase('profiles', 'select', supabase.table('profiles').select('*, careers(*), softskills(*),technicalSkills(*)').eq('id',userId).execute())
+        return user_info_response(response)
+
+    info = await user_info_cache.get_or_create(userId, fetch)
+    pending = profile_writes.pending(userId) if profile_writes is not None else None
+    if pending:
+        # Writes not flushed yet: show them on top of what the database returned
+        name, rows = json.loads(info["body"])["data"]
+        info = user_info_response([name, [{**row, **pending} for row in rows]])
+    return info
+
+
 @app.get('/get_user_info/{userId}')
-async def get_user_info(userId: str):
+async def get_user_info(userId: str, request: Request):
     try:
-        response, count = supabase.table('profiles').select('*, careers(*), softskills(*),technicalSkills(*)').eq('id',userId).execute()
-        
-        return {"data": response}
-        
+        info = await load_user_info(userId)
     except Exception as e:
         print(e)
+        raise HTTPException(status_code=500, detail="Error getting user info")
+
+    headers = {"ETag": info["etag"], "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), info["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=info["body"], media_type="application/json", headers=headers)
         
-@app.post('/get_descrip')
-async def get_descrip(body: dict):
-    # Construct the prompt based on the provided data
-    prompt_text = f"""
-     write a brief description of the {body["career_name"]} course, highlighting its main focus and career paths.
-     In not more than 100 words
-    """
-    
-    try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
-@app.post('/get_scope')
-async def get_scope(body: dict):
-    # Construct the prompt based on the provided data
-    prompt_text = f"""
-     What are the job prospects and scope of the {body["career_name"]} field in Nigeria, and what industries can graduates work in?
-     In not more than 100 words
-    """
-    
-    try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
-@app.post('/get_steps')
-async def get_steps(body: dict):
-    # Construct the prompt based on the provided data
-    prompt_text = f"""
-    Outline the step-by-step process of pursuing a career in {body["career_name"]}, from education to professional certification.
-    In not more than 100 words
-
-    """
-    
-    try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
-@app.post('/get_top_uni')
-async def get_top_uni(body: dict):
-    # Construct the prompt based on the provided data
-    prompt_text = f"""
-   List the top universities in Nigeria that offer {body["career_name"]} courses, including their location and program duration.
-   In not more than 100 words
-
-    """
-    
-    try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
-@app.post('/get_salary')
-async def get_salary(body: dict):
-    # Construct the prompt based on the provided data
-    prompt_text = f"""
-   What is the average salary range per annum for {body["career_name"]} professionals in Nigeria, and how does experience affect salary? 
-   In not more than 100 words
-
-    """
-    
+# Courses offered by the /prompt template; career_name is almost always one of these
+COURSES = [
+    "Medicine and Surgery",
+    "Law",
+    "Civil Engineering",
+    "Mechanical Engineering",
+    "Electrical Engineering",
+    "Computer Science",
+    "Information Technology",
+    "Business Administration",
+    "Accounting",
+    "Nursing and Nursing Science",
+    "Agriculture",
+    "Mass Communication",
+    "Environmental Science",
+    "Education",
+    "Pharmacy",
+]
+
+DETAIL_MODEL = llm_router.model_for("detail")
+
+# Section names accepted by /career_profile and the detail endpoint behind each
+CAREER_SECTIONS = {
+    "description": "get_descrip",
+    "scope": "get_scope",
+    "steps": "get_steps",
+    "top_uni": "get_top_uni",
+    "salary": "get_salary",
+    "top_skills": "get_top_skills",
+    "work_life": "get_work_life",
+}
+
+_COURSE_LOOKUP = {course.casefold(): course for course in COURSES}
+
+content_cache = ContentCache(
+    maxsize=int(os.environ.get("CONTENT_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("CONTENT_CACHE_TTL", 7 * 24 * 3600)),
+    path=CACHE_PATH,
+)
+metrics.register_cache("content", content_cache)
+
+
+def normalize_career_name(career_name: str) -> str:
+    career_name = prompts.clean(career_name, prompts.SHORT_LIMIT)
+    return _COURSE_LOOKUP.get(career_name.casefold(), career_name)
+
+
+async def generate_career_detail(endpoint: str, career_name: str, priority: int = dispatcher.DETAIL) -> str:
+    career_name = normalize_career_name(career_name)
+    key = f"{endpoint}|{career_name.casefold()}|{DETAIL_MODEL}"
+
+    async def generate():
+        prompt = prompts.render(endpoint, career_name=career_name)
+        return await llm_router.complete("detail", prompt.messages, priority=priority, max_tokens=prompt.max_tokens)
+
+    return await content_cache.get_or_create(key, generate)
+
+
+async def career_detail(endpoint: str, career_name: str):
     try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
+        return {"response": await generate_career_detail(endpoint, career_name)}
+    except Overloaded as e:
+        raise too_many_requests(e)
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
 
-@app.post('/get_top_skills')
-async def get_top_skills(body: dict):
-    # Construct the prompt based on the provided data
-    prompt_text = f"""
-        What are the essential skills required to succeed in the {body["career_name"]} field, and how can they be developed?
-        In not more than 100 words
 
-    """
-    
+async def warm_content_cache(concurrency: int = 4):
+    # Pre-generate every (course, section) pair so the detail pages are served warm
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm(endpoint, course):
+        async with semaphore:
+            try:
+                await generate_career_detail(endpoint, course, priority=dispatcher.BACKGROUND)
+            except Exception as e:
+                logger.error("Warm-up failed for %s/%s: %s", endpoint, course, e)
+
+    await asyncio.gather(*[warm(endpoint, course) for endpoint in CAREER_SECTIONS.values() for course in COURSES])
+
+
+def career_detail_endpoint(endpoint: str):
+    async def handler(body: dict):
+        return await career_detail(endpoint, body["career_name"])
+
+    handler.__name__ = endpoint
+    return handler
+
+
+# The seven detail endpoints differ only in their prompt template
+for _endpoint in CAREER_SECTIONS.values():
+    app.add_api_route(f"/{_endpoint}", career_detail_endpoint(_endpoint), methods=["POST"], name=_endpoint)
+
+CAREER_MAX_AGE = int(os.environ.get("CAREER_MAX_AGE", 24 * 3600))
+
+# Encoded bodies per (section, career), kept until the text behind them changes
+career_responses = ContentCache(maxsize=int(os.environ.get("CAREER_RESPONSE_CACHE_SIZE", 1024)))
+
+
+@app.get('/careers/{career_name}/{section}')
+async def getCareerSection(career_name: str, section: str, request: Request):
+    if section not in CAREER_SECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown section: {section}")
     try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
+        text = await generate_career_detail(CAREER_SECTIONS[section], career_name)
+    except Overloaded as e:
+        raise too_many_requests(e)
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
 
-@app.post('/get_work_life')
-async def get_work_life(body: dict):
-    # Construct the prompt based on the provided data
-    prompt_text = f"""
-    What is the typical work-life balance like for {body["career_name"]} professionals, and how can they maintain a healthy balance between work and personal life?
-    In not more than 100 words
-    """
-    
-    try:
-        chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"{prompt_text}",
-            }
-        ],
-        model="llama3-70b-8192",
-        )
-        return {"response": chat_completion.choices[0].message.content}
-    except Exception as e:
-        print(e)
+    key = f"{section}|{normalize_career_name(career_name).casefold()}"
+    encoded = career_responses.get(key)
+    if encoded is None or encoded.content["response"] != text:
+        encoded = EncodedResponse({"response": text})
+        career_responses.set(key, encoded)
+
+    coding = encoded.negotiate(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": encoded.etags[coding],
+        "Cache-Control": f"public, max-age={CAREER_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), encoded.etags[coding]):
+        return Response(status_code=304, headers=headers)
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return Response(content=encoded.bodies[coding], media_type="application/json", headers=headers)
+
+@app.post('/career_profile')
+async def career_profile(body: database.CareerProfileRequest):
+    sections = body.sections or list(CAREER_SECTIONS)
+    unknown = [section for section in sections if section not in CAREER_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown sections: {', '.join(unknown)}")
+
+    # All sections are requested at once so the page waits on the slowest, not the sum
+    async def fetch(section):
+        try:
+            return section, await generate_career_detail(CAREER_SECTIONS[section], body.career_name), None
+        except Overloaded as e:
+            overloaded.append(e)
+            return section, None, "Too many requests, please retry later"
+        except Exception as e:
+            print(e)
+            return section, None, "Error communicating with Groq Api"
+
+    overloaded = []
+
+    tasks = [asyncio.ensure_future(fetch(section)) for section in dict.fromkeys(sections)]
+
+    if body.stream:
+        async def ndjson():
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    section, text, error = await next_done
+                    line = {"section": section, "response": text} if error is None else {"section": section, "error": error}
+                    yield json.dumps(line) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*tasks)
+    errors = {section: error for section, _, error in results if error is not None}
+    if len(errors) == len(results):
+        if overloaded:
+            raise too_many_requests(max(overloaded, key=lambda e: e.retry_after))
         raise HTTPException(status_code=500, detail="Error communicating with Groq Api")
+    return {
+        "career_name": normalize_career_name(body.career_name),
+        "sections": {section: text for section, text, error in results if error is None},
+        "errors": errors,
+    }
+
+# One round trip per write: these tables have a unique constraint on "userId",
+# so PostgREST resolves insert-vs-update itself and concurrent writes can't race.
+async def upsert_for_user(table: str, row: dict):
+    return await timed_supabase(table, 'upsert', supabase.table(table).upsert(row, on_conflict="userId").execute())
 
 @app.post('/addtechnicalSkills')
 async def addTechnicalSkills(body: dict):
     try:
-        
-        technical1 = body["technical1"]
-        technical2 = body["technical2"]
-        technical3  = body["technical3"]
-        userId = body["userId"]
-        response = supabase.table('technicalSkills').select('id','*', count='exact').eq('userId', userId).execute()
-        if response.count > 0:
-            data, count = supabase.table('technicalSkills').update({
-                "technical1": technical1, 
-                "technical2": technical2,
-                "technical3": technical3,
-            }).eq('userId',userId).execute()
-            return {"message": "Career Updated successfully", "data": data}
-        else:
-            data, count = supabase.table('technicalSkills').insert({
-                "technical1": technical1, 
-                "technical2": technical2,
-                "technical3": technical3, 
-                "userId": userId
-            }).execute()
-            return {"message": "Career added successfully", "data": data}
-            
+        data, count = await upsert_for_user('technicalSkills', {
+            "technical1": body["technical1"],
+            "technical2": body["technical2"],
+            "technical3": body["technical3"],
+            "userId": body["userId"]
+        })
+        invalidate_user_info(body["userId"])
+        return {"message": "Technical skills saved successfully", "data": data}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error adding Technical Skill")
     
+async def flush_profile_writes(rows: dict) -> dict:
+    # One update per user, sent together: an update (unlike an upsert) leaves a
+    # missing profile alone, and a row that fails doesn't take the others with it
+    async def write(userId, values):
+        await timed_supabase('profiles', 'update', supabase.table('profiles').update(values).eq('id', userId).execute())
+        invalidate_user_info(userId)
+
+    results = await asyncio.gather(*[write(userId, values) for userId, values in rows.items()], return_exceptions=True)
+    return {userId: result for userId, result in zip(rows, results) if isinstance(result, Exception)}
+
+
+async def update_profile(userId: str, values: dict):
+    if profile_writes is not None:
+        profile_writes.put(userId, values)
+        return [{"id": userId, **values}]
+    data, count = await timed_supabase('profiles', 'update', supabase.table('profiles').update(values).eq('id', userId).execute())
+    invalidate_user_info(userId)
+    return data
+
 @app.post('/update_EducationLevel')
 async def updatehighestEducationLevel(body: dict):
     try:
         userId = body['userId']
         highestEducationLevel = body['highestEducationLevel']
         who_are_you = body['who_are_you']
-        data, count = supabase.table('profiles').update({"highestEducationLevel": highestEducationLevel, "who_are_you": who_are_you}).eq('id',userId).execute()
+        data = await update_profile(userId, {"highestEducationLevel": highestEducationLevel, "who_are_you": who_are_you})
         return {"message": "Updated highestEducationLevel successfully","data": data}
     except Exception as e:
         print(e)
@@ -351,7 +843,7 @@ async def updateActivities(body: dict):
         
         userId = body['userId']
         activities = body['activities']
-        data, count = supabase.table('profiles').update({"activities": activities}).eq('id',userId).execute()
+        data = await update_profile(userId, {"activities": activities})
         return {"message": "Updated Activities successfully"}
     except Exception as e:
         print(e)
@@ -359,36 +851,14 @@ async def updateActivities(body: dict):
 @app.post('/addSoftskill')
 async def addSoftskill(body: dict):
     try:
-        userId = body['userId']
-        response = supabase.table('softskills').select('id','*', count='exact').eq('userId', userId).execute()
-        
-        # Check if the user already has softskills
-        if  response.count > 0:
-            softskill1 = body["softskill1"]
-            softskill2 = body["softskill2"]
-            softskill3 = body["softskill3"]
-            
-            data = supabase.table('softskills').update({
-                "softskill1": softskill1,
-                "softskill2": softskill2,
-                "softskill3": softskill3,
-            }).eq('userId', userId).execute()
-            
-            return {"message": "Updated softskill successfully", "data": data}
-        else:
-            
-            softskill1 = body["softskill1"]
-            softskill2 = body["softskill2"]
-            softskill3 = body["softskill3"]
-            
-            data = supabase.table('softskills').insert({
-                "softskill1": softskill1,
-                "softskill2": softskill2,
-                "softskill3": softskill3,
-                "userId": userId
-            }).execute()
-            
-            return {"message": "Added softskill successfully", "data": data}
+        data, count = await upsert_for_user('softskills', {
+            "softskill1": body["softskill1"],
+            "softskill2": body["softskill2"],
+            "softskill3": body["softskill3"],
+            "userId": body["userId"]
+        })
+        invalidate_user_info(body["userId"])
+        return {"message": "Softskills saved successfully", "data": data}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error in Adding Soft Skill")
@@ -396,34 +866,59 @@ async def addSoftskill(body: dict):
 @app.post('/addcareer')
 async def addCareer(body: dict):
     try:
-        career1 = body['career1']
-        career2 = body['career2']
-        career3 = body['career3']
-        userId= body['userId']
-        response = supabase.table('softskills').select('id','*', count='exact').eq('userId', userId).execute()
-        if response.count > 0:
-            
-            data, count = supabase.table('careers').update({
-                "career1": career1, 
-                "career2": career2,
-                "career3": career3, 
-                
-            }).eq("userId", userId).execute()
-            return {"message": "Career Update successfully","data": data}
-        else:
-            data, count = supabase.table('careers').insert({
-                "career1": career1, 
-                "career2": career2,
-                "career3": career3, 
-                "userId": userId
-            }).execute()
-            return {"message": "Career added successfully","data": data}
+        data, count = await upsert_for_user('careers', {
+            "career1": body['career1'],
+            "career2": body['career2'],
+            "career3": body['career3'],
+            "userId": body['userId']
+        })
+        invalidate_user_info(body['userId'])
+        return {"message": "Career saved successfully", "data": data}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error adding career")
+
+@app.post('/onboarding')
+async def onboarding(body: database.Onboarding):
+    # Every onboarding screen's answers in one call; the writes go out concurrently
+    writes = {}
+    profile = body.model_dump(include={"highestEducationLevel", "who_are_you", "activities"}, exclude_none=True)
+    if profile and profile_writes is not None:
+        # Queued behind any earlier updates for this user so it can't be overwritten by them
+        profile_writes.put(body.userId, profile)
+    elif profile:
+        writes["profile"] = timed_supabase('profiles', 'update', supabase.table('profiles').update(profile).eq('id', body.userId).execute())
+    if body.softskills is not None:
+        writes["softskills"] = upsert_for_user('softskills', {**body.softskills.model_dump(), "userId": body.userId})
+    if body.technicalSkills is not None:
+        writes["technicalSkills"] = upsert_for_user('technicalSkills', {**body.technicalSkills.model_dump(), "userId": body.userId})
+    if body.careers is not None:
+        writes["careers"] = upsert_for_user('careers', {**body.careers.model_dump(), "userId": body.userId})
+    if not writes and not profile:
+        raise HTTPException(status_code=422, detail="Nothing to update")
+
+    results = await asyncio.gather(*writes.values(), return_exceptions=True)
+    invalidate_user_info(body.userId)
+    failed = [name for name, result in zip(writes, results) if isinstance(result, Exception)]
+    for result in results:
+        if isinstance(result, Exception):
+            print(result)
+    if failed:
+        raise HTTPException(status_code=500, detail=f"Error saving onboarding data: {', '.join(failed)}")
+    return {"message": "Onboarding saved successfully", "data": {name: result.data for name, result in zip(writes, results)}}
           
         
+async def warm():
+    async with lifespan(app):
+        await warm_content_cache()
+        print(f"Content cache warm: {len(content_cache)} entries")
+
+
 if __name__ == '__main__':
+    if sys.argv[1:] == ["warm"]:
+        # python main.py warm -- pre-generate all career detail sections and exit
+        asyncio.run(warm())
+        sys.exit(0)
     import uvicorn
     # Run the FastAPI app using Uvicorn on port 8003
     uvicorn.run(app, host="localhost", port=8003)
\ No newline at end of file
@@ -0,0 +1,199 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+import uuid
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# gunicorn.conf.py recreates this directory on start, but anything else run
+# with it set (`python main.py warm`, plain uvicorn) needs it to exist before
+# the first metric below is defined
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+timing_logger = logging.getLogger("wannabe.timing")
+timing_logger.setLevel(logging.INFO)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+# Gauges say how to combine workers' values when running under gunicorn
+# with PROMETHEUS_MULTIPROC_DIR set; single-process mode ignores it
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled", multiprocess_mode="livesum")
+LLM_IN_FLIGHT = Gauge("llm_requests_in_flight", "LLM completions currently in progress", ["provider"], multiprocess_mode="livesum")
+
+LLM_TTFT = Histogram(
+    "llm_time_to_first_token_seconds", "Time until the provider returned the first token",
+    ["provider", "model", "stream"], buckets=LATENCY_BUCKETS,
+)
+LLM_DURATION = Histogram(
+    "llm_request_duration_seconds", "Total time of a chat completion",
+    ["provider", "model", "stream", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens_total", "Prompt tokens reported by the provider", ["provider", "model"])
+LLM_COMPLETION_TOKENS = Counter("llm_completion_tokens_total", "Completion tokens reported by the provider", ["provider", "model"])
+PROMPT_TOKENS = Histogram(
+    "llm_prompt_size_tokens", "Estimated prompt size, by template",
+    ["template"], buckets=(50, 100, 200, 300, 400, 600, 800, 1200, 2000),
+)
+LLM_HEDGES = Counter("llm_hedges_total", "Hedge requests sent, by which call won", ["route", "winner"])
+LLM_CIRCUIT_OPEN = Gauge("llm_circuit_open", "1 while a provider's circuit breaker is open", ["provider"], multiprocess_mode="livemax")
+
+SUPABASE_DURATION = Histogram(
+    "supabase_request_duration_seconds", "Time of a Supabase call",
+    ["table", "operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+
+LLM_QUEUE_DEPTH = Gauge("llm_queue_depth", "LLM calls waiting for admission", ["provider"], multiprocess_mode="livesum")
+LLM_QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds", "Time an LLM call waited for admission",
+    ["provider", "priority"], buckets=LATENCY_BUCKETS,
+)
+LLM_SHED = Counter("llm_shed_total", "LLM calls rejected with a 429", ["provider", "priority"])
+LLM_RETRIES = Counter("llm_retries_total", "LLM calls retried after a provider error", ["provider", "error"])
+
+EVENT_LOOP_LAG = Gauge("event_loop_lag_seconds", "How late the event loop ran a timer, last sample", multiprocess_mode="livemax")
+
+# Upstream time spent on behalf of the current request, for the timing log
+request_id_var = contextvars.ContextVar("request_id", default=None)
+_upstream_var = contextvars.ContextVar("upstream", default=None)
+
+
+def _add_upstream(name, seconds):
+    upstream = _upstream_var.get()
+    if upstream is not None:
+        upstream[name] = upstream.get(name, 0.0) + seconds
+
+
+class CacheCollector:
+    def __init__(self):
+        self.caches = {}
+
+    def collect(self):
+        hits = GaugeMetricFamily("cache_hits", "Cache hits since start", labels=["cache"])
+        misses = GaugeMetricFamily("cache_misses", "Cache misses since start", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Cache hits / lookups since start", labels=["cache"])
+        size = GaugeMetricFamily("cache_entries", "Entries held in memory", labels=["cache"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hit_ratio"])
+            size.add_metric([name], stats["size"])
+        return [hits, misses, ratio, size]
+
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+
+def register_cache(name, cache):
+    cache_collector.caches[name] = cache
+
+
+def record_llm(provider, model, started, first_token=None, usage=None, stream=False, outcome="ok"):
+    elapsed = time.perf_counter() - started
+    stream = "true" if stream else "false"
+    LLM_DURATION.labels(provider, model, stream, outcome).observe(elapsed)
+    if first_token is not None:
+        LLM_TTFT.labels(provider, model, stream).observe(first_token)
+    if usage is not None:
+        LLM_PROMPT_TOKENS.labels(provider, model).inc(usage.prompt_tokens or 0)
+        LLM_COMPLETION_TOKENS.labels(provider, model).inc(usage.completion_tokens or 0)
+    _add_upstream(provider, elapsed)
+
+
+async def timed_supabase(table, operation, awaitable):
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await awaitable
+        outcome = "ok"
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        SUPABASE_DURATION.labels(table, operation, outcome).observe(elapsed)
+        _add_upstream("supabase", elapsed)
+
+
+async def monitor_event_loop_lag(interval=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(loop.time() - started - interval, 0.0))
+
+
+def metrics_response():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Every gunicorn worker writes its samples to that directory; add them
+        # up. Cache stats are in-process counters, so they are this worker's.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(cache_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Times every HTTP request, tags it with a request ID and logs a timing line.
+
+    The X-Request-ID header is reused when the client sends one. The route
+    label is the matched path template, so /get_user_info/{userId} is one
+    series rather than one per user.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        request_id_token = request_id_var.set(request_id)
+        upstream_token = _upstream_var.set({})
+
+        started = time.perf_counter()
+        status = 500
+        REQUESTS_IN_FLIGHT.inc()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            REQUEST_DURATION.labels(scope["method"], route, str(status)).observe(elapsed)
+            upstream = _upstream_var.get() or {}
+            timing_logger.info(json.dumps({
+                "request_id": request_id,
+                "method": scope["method"],
+                "route": route,
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 2),
+                **{f"{name}_ms": round(seconds * 1000, 2) for name, seconds in upstream.items()},
+            }))
+            request_id_var.reset(request_id_token)
+            _upstream_var.reset(upstream_token)
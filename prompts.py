@@ -0,0 +1,133 @@
+import math
+import re
+import string
+import textwrap
+from typing import List, NamedTuple
+
+import metrics
+from dispatcher import estimate_tokens
+
+# English averages about 1.35 tokens per word; the headroom lets a model that
+# runs a little over its word limit finish the sentence instead of being cut off
+TOKENS_PER_WORD = 1.35
+OUTPUT_HEADROOM = 1.2
+
+# Longest value, in characters, each kind of field may put into a prompt
+SHORT_LIMIT = 80
+ACTIVITIES_LIMIT = 400
+
+_CONTROL = re.compile(r"[\x00-\x1f\x7f\u200b-\u200f\u2060\ufeff]")
+
+
+def clean(value, limit: int) -> str:
+    """Collapse whitespace, drop control characters and cut to limit characters at a word break."""
+    value = " ".join(_CONTROL.sub(" ", str(value)).split())
+    if len(value) <= limit:
+        return value
+    cut = value[:limit]
+    return cut.rsplit(" ", 1)[0] if " " in cut else cut
+
+
+class Prompt(NamedTuple):
+    template: str
+    messages: List[dict]
+    max_tokens: int
+    prompt_tokens: int
+
+
+class PromptTemplate:
+    """A prompt with a character limit per field and an output budget.
+
+    The text is dedented and checked against the declared fields once, when
+    the template is registered. render() cleans every field, fills the text
+    in and returns the messages along with max_tokens for the call.
+    """
+
+    def __init__(self, name: str, text: str, fields: dict, max_words: int):
+        self.name = name
+        self.text = textwrap.dedent(text).strip()
+        self.fields = fields
+        placeholders = {field for _, field, _, _ in string.Formatter().parse(self.text) if field}
+        if placeholders != set(fields):
+            raise ValueError(f"Template {name} uses {sorted(placeholders)} but declares {sorted(fields)}")
+        self.max_words = max_words
+        self.max_tokens = math.ceil(max_words * TOKENS_PER_WORD * OUTPUT_HEADROOM)
+
+    def render(self, **values) -> Prompt:
+        content = self.text.format(**{field: clean(values[field], limit) for field, limit in self.fields.items()})
+        tokens = estimate_tokens(content)
+        metrics.PROMPT_TOKENS.labels(self.name).observe(tokens)
+        return Prompt(self.name, [{"role": "user", "content": content}], self.max_tokens, tokens)
+
+
+TEMPLATES = {}
+
+
+def register(name: str, text: str, fields: dict, max_words: int) -> PromptTemplate:
+    TEMPLATES[name] = PromptTemplate(name, text, fields, max_words)
+    return TEMPLATES[name]
+
+
+def render(name: str, **values) -> Prompt:
+    return TEMPLATES[name].render(**values)
+
+
+# Recommendations are shared between users who gave the same answers, so the
+# model never sees a name: it writes this token and each response fills it in
+USERNAME_PLACEHOLDER = "[USERNAME]"
+
+register(
+    "recommendation",
+    """
+    The following three courses have been selected as the most suitable career choices for a user:
+
+     1. {course1}
+     2. {course2}
+     3. {course3}
+
+    The user details are as follows:
+
+    Username: [USERNAME]
+    Favorite Tasks/Activities: {task_activities}
+
+    Soft Skills:
+      1. {softskill1}
+      2. {softskill2}
+      3. {softskill3}
+
+    Technical Skills:
+      1. {technical1}
+      2. {technical2}
+      3. {technical3}
+
+    Career choices:
+     1. {career1}
+     2. {career2}
+     3. {career3}
+
+    Present these three courses in the given order as personalized recommendations. For each one, provide a brief explanation detailing why it aligns well with the user's preferences and skills in 150 words only. Refer to the user only as [USERNAME], written exactly like that.
+    """,
+    fields={
+        "course1": SHORT_LIMIT, "course2": SHORT_LIMIT, "course3": SHORT_LIMIT,
+        "task_activities": ACTIVITIES_LIMIT,
+        "softskill1": SHORT_LIMIT, "softskill2": SHORT_LIMIT, "softskill3": SHORT_LIMIT,
+        "technical1": SHORT_LIMIT, "technical2": SHORT_LIMIT, "technical3": SHORT_LIMIT,
+        "career1": SHORT_LIMIT, "career2": SHORT_LIMIT, "career3": SHORT_LIMIT,
+    },
+    # 150 words for each of the three courses
+    max_words=450,
+)
+
+# Career detail sections, keyed by the endpoint that serves them
+DETAIL_QUESTIONS = {
+    "get_descrip": "write a brief description of the {career_name} course, highlighting its main focus and career paths.",
+    "get_scope": "What are the job prospects and scope of the {career_name} field in Nigeria, and what industries can graduates work in?",
+    "get_steps": "Outline the step-by-step process of pursuing a career in {career_name}, from education to professional certification.",
+    "get_top_uni": "List the top universities in Nigeria that offer {career_name} courses, including their location and program duration.",
+    "get_salary": "What is the average salary range per annum for {career_name} professionals in Nigeria, and how does experience affect salary?",
+    "get_top_skills": "What are the essential skills required to succeed in the {career_name} field, and how can they be developed?",
+    "get_work_life": "What is the typical work-life balance like for {career_name} professionals, and how can they maintain a healthy balance between work and personal life?",
+}
+
+for _endpoint, _question in DETAIL_QUESTIONS.items():
+    register(_endpoint, f"{_question}\nIn not more than 100 words", fields={"career_name": SHORT_LIMIT}, max_words=100)
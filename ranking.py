@@ -0,0 +1,115 @@
+import functools
+import json
+import re
+
+import numpy as np
+
+# A course named outright in the input counts for more than any single keyword
+COURSE_NAME_WEIGHT = 4.0
+
+GROUPS = {
+    "task_activities": ("task_activities",),
+    "softskills": ("softskill1", "softskill2", "softskill3"),
+    "technical": ("technical1", "technical2", "technical3"),
+    "careers": ("career1", "career2", "career3"),
+}
+
+_WORD = re.compile(r"[a-z0-9+#]+")
+
+
+class RankingEngine:
+    """Scores the recommendation courses for UserInput records without an LLM.
+
+    The affinity matrix (features x courses) and the per-group weights come
+    from a JSON file, see course_affinity.json. Inputs are turned into feature
+    vectors and scored with a single matrix product, so ranking a batch costs
+    about the same as ranking one record.
+    """
+
+    def __init__(self, courses, features, group_weights):
+        self.courses = list(courses)
+        self.group_weights = dict(group_weights)
+        course_index = {course: i for i, course in enumerate(self.courses)}
+
+        features = dict(features)
+        for course in self.courses:
+            weights = dict(features.get(course.lower(), {}))
+            weights[course] = max(weights.get(course, 0), COURSE_NAME_WEIGHT)
+            features[course.lower()] = weights
+
+        self.vocabulary = list(features)
+        self.feature_index = {feature: i for i, feature in enumerate(self.vocabulary)}
+        self.max_ngram = max(len(feature.split()) for feature in self.vocabulary)
+        self.matrix = np.zeros((len(self.vocabulary), len(self.courses)), dtype=np.float32)
+        for i, feature in enumerate(self.vocabulary):
+            for course, weight in features[feature].items():
+                self.matrix[i, course_index[course]] = weight
+        # Pick-list values repeat a lot, so remember which features each string matched
+        self._features = functools.lru_cache(maxsize=4096)(self._match)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config["courses"], config["features"], config.get("group_weights", {}))
+
+    def _match(self, text):
+        words = _WORD.findall(text.lower())
+        found = []
+        for n in range(1, self.max_ngram + 1):
+            for i in range(len(words) - n + 1):
+                index = self.feature_index.get(" ".join(words[i:i + n]))
+                if index is not None and index not in found:
+                    found.append(index)
+        return tuple(found)
+
+    def encode(self, body):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for group, fields in GROUPS.items():
+            weight = self.group_weights.get(group, 1.0)
+            for field in fields:
+                for index in self._features(getattr(body, field)):
+                    vector[index] += weight
+        return vector
+
+    def score_batch(self, bodies):
+        inputs = np.stack([self.encode(body) for body in bodies]) if bodies else np.zeros((0, len(self.vocabulary)), dtype=np.float32)
+        return inputs @ self.matrix
+
+    def score(self, body):
+        return self.encode(body) @ self.matrix
+
+    def _top(self, scores, k):
+        # Stable sort keeps the template's course order as the tie-breaker
+        return [int(i) for i in np.argsort(-scores, kind="stable")[:k]]
+
+    def rank(self, body, k=3):
+        scores = self.score(body)
+        return [(self.courses[i], float(scores[i])) for i in self._top(scores, k)]
+
+    def rank_batch(self, bodies, k=3):
+        scores = self.score_batch(bodies)
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        return [
+            [(self.courses[i], float(score)) for i, score in zip(row, row_scores)]
+            for row, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]
+
+    def reasons(self, body, course, limit=3):
+        # The matched features that contributed most to this course's score
+        column = self.matrix[:, self.courses.index(course)]
+        contributions = self.encode(body) * column
+        order = np.argsort(-contributions, kind="stable")[:limit]
+        return [self.vocabulary[i] for i in order if contributions[i] > 0]
+
+    def explain(self, body, ranked):
+        lines = [f"Here are the top three courses for {body.username.strip() or 'you'}:", ""]
+        for position, (course, _) in enumerate(ranked, start=1):
+            reasons = self.reasons(body, course)
+            if reasons:
+                why = f"it builds on your interest in {', '.join(reasons)}"
+            else:
+                why = "it is a well-rounded fit for your profile"
+            lines.append(f"{position}. {course}: recommended because {why}.")
+        return "\n".join(lines)
@@ -0,0 +1,34 @@
+"""Caches sharing one SQLite file, as gunicorn workers do."""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cache import ContentCache  # noqa: E402
+
+
+def test_fill_racing_a_delete_in_another_process_is_not_stored(tmp_path):
+    path = str(tmp_path / "cache.db")
+    worker_a = ContentCache(path=path, table="user_info", local_ttl=0)
+    worker_b = ContentCache(path=path, table="user_info", local_ttl=0)
+
+    async def run():
+        fetching = asyncio.Event()
+
+        async def fetch_before_write():
+            fetching.set()
+            await asyncio.sleep(0.05)
+            return {"name": "before"}
+
+        fill = asyncio.ensure_future(worker_a.get_or_create("user-1", fetch_before_write))
+        await fetching.wait()
+        # Worker B writes the profile and invalidates while A's read is in flight
+        worker_b.delete("user-1")
+        assert await fill == {"name": "before"}
+
+    asyncio.run(run())
+
+    assert worker_a.get("user-1") is None
+    assert worker_b.get("user-1") is None
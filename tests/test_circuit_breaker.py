@@ -0,0 +1,101 @@
+"""A half-open circuit must not stay stuck when its probe is never sent.
+
+The probe is claimed before the call queues for a dispatcher slot; if it is
+shed there (Overloaded) or cancelled, the provider never saw it, and the
+next call has to be allowed to probe instead.
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dispatcher import Overloaded  # noqa: E402
+from llm_router import LLMRouter  # noqa: E402
+
+COOLDOWN = 0.05
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class FakeStream:
+    def __init__(self, text):
+        self._chunks = iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])])
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, model, stream, **kwargs):
+        self.calls += 1
+        return FakeStream("ok")
+
+    async def close(self):
+        pass
+
+
+def make_router():
+    router = LLMRouter({
+        "providers": {"groq": {"type": "groq", "api_key_env": "UNUSED", "max_concurrency": 1, "max_wait": 0.1}},
+        "routes": {"detail": {"primary": {"provider": "groq", "model": "m"}}},
+        "circuit_breaker": {"cooldown": COOLDOWN},
+    })
+    provider = router.providers["groq"]
+    provider.client = FakeClient()
+    provider.breaker._open()
+    return router, provider
+
+
+async def wait_out_cooldown_with_busy_slot(provider):
+    await asyncio.sleep(COOLDOWN)
+    # Someone else holds the only slot, so the probe has to queue
+    await provider.dispatcher.acquire(0, 1)
+
+
+def test_probe_shed_while_queued_releases_the_circuit():
+    async def run():
+        router, provider = make_router()
+        await wait_out_cooldown_with_busy_slot(provider)
+        with pytest.raises(Overloaded):
+            await router.complete("detail", MESSAGES)
+        assert provider.client.calls == 0
+        provider.dispatcher.release()
+
+        assert await router.complete("detail", MESSAGES) == "ok"
+        assert provider.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_probe_cancelled_while_queued_releases_the_circuit():
+    async def run():
+        router, provider = make_router()
+        await wait_out_cooldown_with_busy_slot(provider)
+        probe = asyncio.ensure_future(router.complete("detail", MESSAGES))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        provider.dispatcher.release()
+
+        assert await router.complete("detail", MESSAGES) == "ok"
+        assert provider.breaker.state == "closed"
+
+    asyncio.run(run())
@@ -0,0 +1,103 @@
+"""Slow upstream calls must overlap instead of queueing on the event loop.
+
+A local completions server answers every request after DELAY seconds; N
+parallel /get_descrip requests should then finish in about one DELAY, not N.
+
+    python -m pytest tests
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import httpx
+import jwt
+import pytest
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DELAY = 1.0
+PARALLEL = 10
+
+fake_llm = FastAPI()
+fake_llm_requests = []
+
+
+@fake_llm.post("/openai/v1/chat/completions")
+@fake_llm.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    fake_llm_requests.append(body)
+
+    async def chunks():
+        await asyncio.sleep(DELAY)
+        chunk = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "delta": {"content": "A fine course."}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+@pytest.fixture(scope="module")
+def fake_llm_url():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(fake_llm, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture(scope="module")
+def app_module(fake_llm_url):
+    os.environ.update({
+        "GROQ_API_KEY": "test",
+        "GROQ_BASE_URL": fake_llm_url,
+        "API_KEY": "test",
+        "OPENAI_BASE_URL": f"{fake_llm_url}/v1",
+        # Never contacted by these requests; supabase-py only checks the key looks like a JWT
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_ANON_KEY": jwt.encode({"role": "anon"}, "test-secret-test-secret-test-sec", algorithm="HS256"),
+        "CONTENT_CACHE_PATH": "",
+        "BULK_JOBS_PATH": "",
+    })
+    import main
+
+    return main
+
+
+def test_parallel_slow_calls_overlap(app_module):
+    async def run():
+        async with app_module.lifespan(app_module.app):
+            transport = httpx.ASGITransport(app=app_module.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=30) as client:
+                started = time.perf_counter()
+                # A different career per request so none are served from the cache
+                responses = await asyncio.gather(*[
+                    client.post("/get_descrip", json={"career_name": course})
+                    for course in app_module.COURSES[:PARALLEL]
+                ])
+                return time.perf_counter() - started, responses
+
+    elapsed, responses = asyncio.run(run())
+
+    assert [response.status_code for response in responses] == [200] * PARALLEL
+    assert all(response.json()["response"] == "A fine course." for response in responses)
+    assert len(fake_llm_requests) == PARALLEL
+    # Serialized calls would take PARALLEL * DELAY
+    assert DELAY <= elapsed < 2 * DELAY
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Coalesces per-key column writes in memory and flushes them in batches.
+
+    put() merges into whatever is already pending for the key, so the last
+    write to each column wins and a burst of updates costs one row in the
+    next batch. flush(rows) is awaited with {key: {column: value}} every
+    `interval` seconds, or sooner once max_batch keys are pending, and
+    returns {key: error} for the rows it couldn't write (raising fails them
+    all). Failed rows are merged back under any newer writes and retried on
+    the next tick; after max_attempts failures in a row they are dropped
+    and logged, so one bad row can't hold up the rest. Writes stay visible
+    through pending() until they are written or dropped.
+    """
+
+    def __init__(self, flush, interval=0.5, max_batch=100, max_attempts=5):
+        self._flush = flush
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self._pending = {}
+        self._flushing = {}
+        self._attempts = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._pending) + len(self._flushing)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, key, values):
+        self._pending.setdefault(key, {}).update(values)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def pending(self, key):
+        if key not in self._pending and key not in self._flushing:
+            return None
+        return {**self._flushing.get(key, {}), **self._pending.get(key, {})}
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _requeue(self, key, values):
+        # Put a row back without clobbering anything written to it since
+        self._pending[key] = {**values, **self._pending.get(key, {})}
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            batch = self._flushing = self._pending
+            self._pending = {}
+            try:
+                try:
+                    failed = await self._flush(batch) or {}
+                except Exception as e:
+                    failed = dict.fromkeys(batch, e)
+            except BaseException:
+                for key, values in batch.items():
+                    self._requeue(key, values)
+                raise
+            finally:
+                self._flushing = {}
+            for key in batch:
+                if key not in failed:
+                    self._attempts.pop(key, None)
+            for key, error in failed.items():
+                attempts = self._attempts.pop(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    logger.error("Dropping write-behind row %s after %d failed attempts: %s %s", key, attempts, batch[key], error)
+                    continue
+                logger.error("Write-behind row %s failed, will retry: %s", key, error)
+                self._attempts[key] = attempts
+                self._requeue(key, batch[key])
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error("Lost %d pending writes on shutdown: %s", len(self._pending), self._pending)